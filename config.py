@@ -19,12 +19,88 @@ GEMINI_MODEL = "gemini-2.5-flash"
 # Modelo de Embeddings Multimodal (Basado en OpenCLIP/HuggingFace)
 # Este modelo genera el vector para la imagen Y el vector para el texto.
 CLIP_MODEL_NAME = "openai/clip-vit-large-patch14"
+# Longitud máxima de texto de CLIP (tokens, incluidos los 2 especiales)
+CLIP_MAX_TOKENS = 77
+# Solapamiento entre chunks consecutivos, medido en tokens CLIP
+CLIP_CHUNK_OVERLAP_TOKENS = 12
+
+# --- Pipeline de Ingesta (Decodificación de imágenes en paralelo) ---
+# Hilos que decodifican y preprocesan JPEGs mientras el modelo codifica el lote anterior
+INGEST_DECODE_WORKERS = 4
+# Máximo de imágenes decodificadas/en vuelo por delante del modelo (cola acotada)
+INGEST_PREFETCH_IMAGES = 16
+# Imágenes por pasada del encoder de imagen CLIP
+INGEST_IMAGE_BATCH_SIZE = 8
+# Chunks por escritura en ChromaDB; tras cada escritura se guarda un checkpoint
+INGEST_WRITE_BATCH_SIZE = 256
+
+# --- Micro-batching de Queries (Encoder de texto CLIP) ---
+# Las queries concurrentes se agrupan durante un máximo de QUERY_BATCH_MAX_WAIT_MS
+# milisegundos (o hasta QUERY_BATCH_MAX_SIZE textos) y se codifican en una sola pasada.
+QUERY_BATCH_ENABLED = True
+QUERY_BATCH_MAX_SIZE = 32
+QUERY_BATCH_MAX_WAIT_MS = 5.0
+
+# --- Búsqueda Híbrida (Vectorial + Grafo) ---
+# Constante k de Reciprocal Rank Fusion: score = sum(1 / (k + rank))
+HYBRID_RRF_K = 60
+# Número de resultados que devuelve la rama vectorial y la fusión final
+HYBRID_N_RESULTS = 3
+
+# --- Empaquetado de Contexto (antes de la Generación) ---
+# Máximo de vagones (archivos distintos) que se envían a Gemini
+CONTEXT_MAX_FILES = 5
+# Presupuesto aproximado de tokens para el texto de contexto del prompt
+CONTEXT_TOKEN_BUDGET = 1500
+# Heurística de estimación: caracteres por token
+CONTEXT_CHARS_PER_TOKEN = 4
+
+# --- Métricas de Latencia ---
+# Activar con: export RAG_METRICS=1  (desactivadas, los spans no tienen coste apreciable)
+METRICS_ENABLED = os.environ.get("RAG_METRICS", "0") == "1"
+
+# --- Almacenamiento Compacto de Embeddings ---
+# "float32" (original) o "pca" (proyección ajustada sobre el corpus, reduce el índice de Chroma).
+# Para comparar opciones (incluye float16/int8 como referencia, no desplegables):
+#   python src/evaluation/compression_report.py
+EMBEDDING_STORAGE = "float32"
+# Dimensión de salida en modo "pca" (se limita al número de vectores usados para ajustar)
+EMBEDDING_PCA_DIM = 256
+# Vectores que se acumulan antes del primer lote para ajustar la PCA
+EMBEDDING_PCA_FIT_SAMPLES = 2048
+# Codec guardado junto a la colección (dentro de CHROMA_PERSIST_DIR); el retriever lo aplica a las queries
+EMBEDDING_CODEC_FILENAME = "embedding_codec.npz"
+
+# --- Ejecución de Queries en Lote (python main.py batch ...) ---
+# Hilos concurrentes: las queries en vuelo se agrupan en el micro-batcher del encoder CLIP
+BATCH_WORKERS = 32
+# Filas por escritura de resultados (JSONL se vacía a disco en cada escritura; Parquet crea un part-file)
+BATCH_FLUSH_EVERY = 100
+
+# --- Recarga en Caliente del Grafo de Conocimiento ---
+# Si está activo, graph_agent vigila knowledge_graph.gpickle y su change log y publica la nueva versión sin reiniciar
+GRAPH_WATCH_ENABLED = True
+GRAPH_RELOAD_POLL_SECONDS = 2.0
+# upsert_wagon/remove_wagon escriben en knowledge_graph.changes.jsonl; al superar este tamaño
+# se compacta en el pickle (los procesos que sirven hacen entonces una única recarga completa)
+GRAPH_CHANGELOG_COMPACT_BYTES = 1024 * 1024
 
 # --- Configuración de ChromaDB ---
 # Nombre de la Colección (el índice donde se guardan los datos)
 CHROMA_COLLECTION_NAME = "vagones_multimodal_clip"
 # Cliente: Usaremos el modo persistente (local) para simplificar
 CHROMA_PERSIST_DIR = BASE_DIR / "chroma_db"
+# Número de shards: con N > 1 la colección se reparte por hash de 'filename' en
+# CHROMA_PERSIST_DIR/shard_XX y cada shard se sirve desde su propio proceso
+CHROMA_NUM_SHARDS = 1
+# Tiempo máximo de espera por shard en cada búsqueda (los shards lentos se ignoran)
+CHROMA_SHARD_TIMEOUT_S = 2.0
+# Checkpoint de la ingesta (dentro de CHROMA_PERSIST_DIR): permite reanudar desde el último lote escrito
+INGEST_CHECKPOINT_FILENAME = "ingest_checkpoint.json"
+# Pre-filtrado por metadatos: los colores/cargas detectados en la query se pasan como `where`
+CHROMA_METADATA_PREFILTER = True
+# Factor de sobre-recuperación: se piden n_results * factor chunks para llenar n archivos distintos
+CHROMA_OVERFETCH_FACTOR = 4
 
 # --- Simulación de Dataset (Reemplazar con tus 13 datos reales) ---
 # Se utiliza para la ingesta. Debes asegurar 1 a 1 correspondencia.
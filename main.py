@@ -1,10 +1,20 @@
 # main.py
-from src.ingestion.ingestion_chroma import load_data_to_chroma
-from src.components.retriever import search_chroma
-from src.components.generator import generate_response
+import sys
+from src.components.metrics import metrics
 import config
 
 if __name__ == "__main__":
+    # Modo lote: python main.py batch queries.jsonl --mode hybrid --output resultados.jsonl
+    # Va antes de los imports de la demo: el runner solo carga lo que necesita su modo (sin CLIP en 'graph')
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from src.evaluation.batch_runner import main as batch_main
+        batch_main(sys.argv[2:])
+        sys.exit(0)
+
+    from src.ingestion.ingestion_chroma import load_data_to_chroma
+    from src.components.retriever import search_chroma
+    from src.components.generator import generate_response
+
     print("==============================================")
     print("       🚀 Proyecto Final RAG Multimodal        ")
     print("==============================================")
@@ -42,4 +52,8 @@ if __name__ == "__main__":
     
     print("\n[Respuesta del Sistema RAG]:")
     print(respuesta_2)
-    print("==============================================")
\ No newline at end of file
+    print("==============================================")
+
+    # Latencias por etapa (solo si RAG_METRICS=1)
+    if metrics.enabled:
+        print(metrics.export_prometheus())
\ No newline at end of file
@@ -0,0 +1,53 @@
+# src/components/attributes.py
+import unicodedata
+
+# Vocabulario de atributos (reglas básicas; el mismo que usa el grafo de conocimiento)
+COLORES = ["rojo", "azul", "verde", "amarillo", "gris", "blanco", "negro", "oxidado"]
+CARGAS = ["petróleo", "neft", "carbón", "madera", "grano", "sellado", "abierto", "cisterna"]
+
+
+def extract_attributes(text: str) -> dict:
+    """Detecta colores y cargas/tipos mencionados en un texto (descripción o query)."""
+    text_lower = text.lower()
+    return {
+        "colores": [color for color in COLORES if color in text_lower],
+        "cargas": [carga for carga in CARGAS if carga in text_lower],
+    }
+
+
+def metadata_key(prefix: str, term: str) -> str:
+    """Clave de metadato ASCII para ChromaDB (ej: 'carga_petroleo')."""
+    ascii_term = unicodedata.normalize("NFKD", term).encode("ascii", "ignore").decode("ascii")
+    return f"{prefix}_{ascii_term}"
+
+
+def attributes_to_metadata(attributes: dict) -> dict:
+    """Convierte los atributos en flags booleanos (ChromaDB no admite listas como metadato)."""
+    metadata = {}
+    for color in attributes["colores"]:
+        metadata[metadata_key("color", color)] = True
+    for carga in attributes["cargas"]:
+        metadata[metadata_key("carga", carga)] = True
+    return metadata
+
+
+def build_where_filter(query: str):
+    """
+    Construye el filtro `where` de ChromaDB a partir de los atributos de la query.
+
+    Dentro de una categoría los términos se combinan con OR ("rojo o gris") y entre
+    categorías con AND (color Y carga). Devuelve None si la query no menciona atributos.
+    """
+    attributes = extract_attributes(query)
+
+    clauses = []
+    for prefix, terms in (("color", attributes["colores"]), ("carga", attributes["cargas"])):
+        conditions = [{metadata_key(prefix, term): True} for term in terms]
+        if len(conditions) == 1:
+            clauses.append(conditions[0])
+        elif conditions:
+            clauses.append({"$or": conditions})
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
@@ -0,0 +1,81 @@
+# src/components/context_packer.py
+import math
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import config
+
+# Coste fijo aproximado de la cabecera de cada contexto ("--- CONTEXTO i (Archivo: ..., Score: ...) ---")
+CONTEXT_HEADER_TOKENS = 20
+# Por debajo de este margen no merece la pena recortar una descripción para que quepa
+MIN_TRUNCATED_TOKENS = 32
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida de tokens a partir del número de caracteres."""
+    return max(1, math.ceil(len(text) / config.CONTEXT_CHARS_PER_TOKEN))
+
+
+def group_by_file(retrieved_context: list) -> list:
+    """
+    Agrupa los chunks recuperados por 'filename'.
+
+    El orden de los archivos es el de su mejor chunk (la lista de entrada ya viene
+    ordenada por relevancia) y las descripciones de los chunks distintos se concatenan.
+    """
+    grouped = {}
+    for item in retrieved_context:
+        filename = item['filename']
+        if filename not in grouped:
+            grouped[filename] = dict(item, description_parts=[item['description']])
+            continue
+
+        entry = grouped[filename]
+        entry['relevance_score'] = max(entry['relevance_score'], item['relevance_score'])
+        if item['description'] not in entry['description_parts']:
+            entry['description_parts'].append(item['description'])
+
+    result = []
+    for entry in grouped.values():
+        parts = entry.pop('description_parts')
+        entry['description'] = " ".join(parts)
+        result.append(entry)
+    return result
+
+
+def pack_context(retrieved_context: list, max_files: int = None, token_budget: int = None) -> list:
+    """
+    Prepara el contexto para el generador: un elemento por vagón y un presupuesto de tokens.
+
+    Args:
+        retrieved_context (list): Contexto recuperado (chunks o archivos), ordenado por relevancia.
+        max_files (int): Máximo de archivos distintos (por defecto config.CONTEXT_MAX_FILES).
+        token_budget (int): Tokens máximos de texto de contexto (por defecto config.CONTEXT_TOKEN_BUDGET).
+
+    Returns:
+        list: Contexto agrupado por archivo que cabe en el presupuesto. El primer archivo
+        siempre se incluye (recortado si hace falta).
+    """
+    max_files = max_files or config.CONTEXT_MAX_FILES
+    token_budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+
+    packed = []
+    used_tokens = 0
+
+    for item in group_by_file(retrieved_context)[:max_files]:
+        cost = CONTEXT_HEADER_TOKENS + estimate_tokens(item['description'])
+
+        if used_tokens + cost <= token_budget:
+            packed.append(item)
+            used_tokens += cost
+            continue
+
+        # No cabe entero: recortamos si queda margen útil (o si es el único resultado)
+        remaining = token_budget - used_tokens - CONTEXT_HEADER_TOKENS
+        if remaining >= MIN_TRUNCATED_TOKENS or not packed:
+            max_chars = max(remaining, MIN_TRUNCATED_TOKENS) * config.CONTEXT_CHARS_PER_TOKEN
+            packed.append(dict(item, description=item['description'][:max_chars].rstrip() + "…"))
+        break
+
+    return packed
@@ -0,0 +1,186 @@
+# src/components/embedding_codec.py
+import numpy as np
+from pathlib import Path
+
+# Modos de almacenamiento soportados en la ingesta
+STORAGE_MODES = ("float32", "pca")
+# Precisiones reducidas que solo se SIMULAN en el informe: ChromaDB guarda siempre float32,
+# así que en el índice desplegado no ahorrarían memoria (solo perderían recall)
+HYPOTHETICAL_PRECISIONS = ("float16", "int8")
+
+
+class EmbeddingCodec:
+    """
+    Transforma los embeddings antes de guardarlos y las queries antes de buscar.
+
+    Modos:
+        - float32: sin cambios (comportamiento original).
+        - pca: proyección a `pca_dim` componentes principales ajustadas sobre el corpus.
+          Es el único modo que reduce el tamaño real del índice de ChromaDB.
+
+    En ambos modos el vector resultante se re-normaliza (L2) para que las distancias
+    sigan siendo comparables con las de la ingesta original.
+    """
+
+    def __init__(self, mode: str = "float32", pca_dim: int = 256):
+        if mode not in STORAGE_MODES:
+            raise ValueError(f"Modo de almacenamiento desconocido: {mode}. Opciones: {STORAGE_MODES}")
+        self.mode = mode
+        self.pca_dim = pca_dim
+        self.mean = None
+        self.components = None
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.mode != "pca" or self.components is not None
+
+    @property
+    def output_dim(self):
+        return self.components.shape[0] if self.components is not None else None
+
+    def fit(self, vectors):
+        """Ajusta la proyección PCA sobre una muestra del corpus (no-op en los demás modos)."""
+        if self.mode != "pca":
+            return self
+        X = np.asarray(vectors, dtype=np.float32)
+        n_components = min(self.pca_dim, X.shape[0], X.shape[1])
+        self.mean = X.mean(axis=0)
+        # SVD de la matriz centrada: las filas de Vt son las direcciones principales
+        _, _, Vt = np.linalg.svd(X - self.mean, full_matrices=False)
+        self.components = Vt[:n_components].astype(np.float32)
+        return self
+
+    def _project(self, X: np.ndarray) -> np.ndarray:
+        if self.mode == "pca":
+            if self.components is None:
+                raise RuntimeError("El codec PCA no está ajustado. Llama a fit() primero.")
+            X = (X - self.mean) @ self.components.T
+        return X
+
+    @staticmethod
+    def _normalize(X: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(X, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return X / norms
+
+    def encode(self, vectors) -> list:
+        """Vectores del corpus -> vectores a guardar en ChromaDB (lista de listas)."""
+        X = self._normalize(self._project(np.asarray(vectors, dtype=np.float32)))
+        return X.tolist()
+
+    def encode_query(self, vector: list) -> list:
+        """Query -> espacio de búsqueda (proyección PCA; sin cambios en float32)."""
+        if self.mode != "pca":
+            return vector
+        X = self._normalize(self._project(np.asarray([vector], dtype=np.float32)))
+        return X[0].tolist()
+
+    def bytes_per_vector(self, input_dim: int) -> int:
+        """Bytes reales por vector en ChromaDB (float32)."""
+        return 4 * (self.output_dim or input_dim)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {"mode": np.array(self.mode), "pca_dim": np.array(self.pca_dim)}
+        if self.components is not None:
+            arrays["mean"] = self.mean
+            arrays["components"] = self.components
+        # np.savez añade '.npz' si falta: abrimos el archivo nosotros para respetar la ruta
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            codec = cls(mode=str(data["mode"]), pca_dim=int(data["pca_dim"]))
+            if "components" in data:
+                codec.mean = data["mean"]
+                codec.components = data["components"]
+        return codec
+
+
+def simulate_precision(X: np.ndarray, precision: str):
+    """
+    Redondea los vectores como quedarían guardados en `precision` y los devuelve en float32,
+    junto con los bytes por vector que ocuparían en un almacén que sí usara ese formato.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    if precision == "float16":
+        return X.astype(np.float16).astype(np.float32), 2 * X.shape[1]
+    if precision == "int8":
+        # Cuantización simétrica por vector a [-127, 127]
+        scale = np.abs(X).max(axis=1, keepdims=True) / 127.0
+        scale[scale == 0] = 1.0
+        codes = np.round(X / scale).astype(np.int8)
+        return codes.astype(np.float32) * scale, X.shape[1] + 4  # códigos int8 + escala float32
+    raise ValueError(f"Precisión desconocida: {precision}. Opciones: {HYPOTHETICAL_PRECISIONS}")
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Índices de los k vecinos más cercanos (L2) de cada query, por fuerza bruta."""
+    # ||q - c||^2 = ||q||^2 - 2 q·c + ||c||^2  (||q||^2 no cambia el orden)
+    distances = -2.0 * queries @ corpus.T + (corpus ** 2).sum(axis=1)[None, :]
+    k = min(k, corpus.shape[0])
+    top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(distances, top, axis=1).argsort(axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall_memory_tradeoff(corpus, queries, k: int = 10, configs=None) -> list:
+    """
+    Compara cada configuración de almacenamiento contra la búsqueda exacta en float32.
+
+    Args:
+        corpus: Embeddings del corpus en float32 (N, D), tal como salen de la ingesta.
+        queries: Vectores de query (Q, D).
+        k (int): Profundidad del recall (recall@k).
+        configs (list): Pares (modo, pca_dim). Por defecto float32, PCA 512/256/128/64 y,
+            como referencia hipotética, float16 e int8.
+
+    Returns:
+        list: Una fila (dict) por configuración con dimensión, bytes por vector,
+        memoria total estimada del corpus (MB), recall@k y si el modo se puede usar
+        en la ingesta (`deployable`). Las filas float16/int8 no son desplegables:
+        ChromaDB guardaría igualmente float32. Las PCA que dan la misma dimensión
+        (corpus más pequeño que `pca_dim`) aparecen una sola vez.
+    """
+    corpus = np.asarray(corpus, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    configs = configs or [("float32", None), ("pca", 512), ("pca", 256), ("pca", 128), ("pca", 64),
+                          ("float16", None), ("int8", None)]
+
+    truth = exact_top_k(corpus, queries, k)
+    k_eff = truth.shape[1]
+
+    rows = []
+    seen = set()
+    for mode, pca_dim in configs:
+        if mode in HYPOTHETICAL_PRECISIONS:
+            stored, bytes_per_vector = simulate_precision(corpus, mode)
+            projected_queries = queries
+            label, dim, deployable = f"{mode} (hipotético)", corpus.shape[1], False
+        else:
+            codec = EmbeddingCodec(mode=mode, pca_dim=pca_dim or corpus.shape[1]).fit(corpus)
+            stored = np.asarray(codec.encode(corpus), dtype=np.float32)
+            projected_queries = np.asarray([codec.encode_query(q) for q in queries.tolist()], dtype=np.float32)
+            bytes_per_vector = codec.bytes_per_vector(corpus.shape[1])
+            dim = codec.output_dim or corpus.shape[1]
+            label, deployable = (mode if mode != "pca" else f"pca-{dim}"), True
+
+        if label in seen:
+            continue
+        seen.add(label)
+
+        found = exact_top_k(stored, projected_queries, k)
+        hits = sum(len(set(t) & set(f)) for t, f in zip(truth.tolist(), found.tolist()))
+        rows.append({
+            "mode": label,
+            "dim": dim,
+            "bytes_per_vector": bytes_per_vector,
+            "index_mb": bytes_per_vector * corpus.shape[0] / 1e6,
+            "memory_ratio": bytes_per_vector / (4 * corpus.shape[1]),
+            f"recall@{k_eff}": hits / (k_eff * len(queries)),
+            "deployable": deployable,
+        })
+    return rows
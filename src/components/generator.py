@@ -8,6 +8,8 @@ from PIL import Image
 # Añadir el directorio raíz al path para importar config
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 import config
+from src.components.context_packer import pack_context
+from src.components.metrics import metrics
 
 # Inicializar el cliente de Gemini
 client = genai.Client(api_key=config.GEMINI_API_KEY)
@@ -40,6 +42,9 @@ def generate_response(user_prompt: str, retrieved_context: list):
     if not retrieved_context:
         return "Lo siento, la búsqueda vectorial no encontró información relevante para tu pregunta."
 
+    # Un contexto por vagón y dentro del presupuesto de tokens del prompt
+    retrieved_context = pack_context(retrieved_context)
+
     # 1. Agrupar TODAS las descripciones recuperadas en un solo bloque de texto.
     context_descriptions_text = ""
     for i, context in enumerate(retrieved_context):
@@ -51,7 +56,9 @@ def generate_response(user_prompt: str, retrieved_context: list):
     
     try:
         image_path = best_context_for_image['image_path']
-        image = Image.open(image_path)
+        with metrics.span("image_open"):
+            image = Image.open(image_path)
+            image.load()
         filename = best_context_for_image['filename']
         
         # 2. Formular el prompt final
@@ -74,16 +81,18 @@ def generate_response(user_prompt: str, retrieved_context: list):
         ]
         
         # 4. Llamada a la API
-        response = client.models.generate_content(
-            model=config.GEMINI_MODEL,
-            contents=contents,
-            config=types.GenerateContentConfig(
-                system_instruction=SYSTEM_PROMPT
+        with metrics.span("gemini_generate"):
+            response = client.models.generate_content(
+                model=config.GEMINI_MODEL,
+                contents=contents,
+                config=types.GenerateContentConfig(
+                    system_instruction=SYSTEM_PROMPT
+                )
             )
-        )
         
         return response.text
         
     except Exception as e:
+        metrics.inc("generation_errors")
         print(f"Error en la generación de Gemini: {e}")
         return "Ocurrió un error al contactar al modelo generador. Revisa tu clave API y la ruta de la imagen."
\ No newline at end of file
@@ -1,5 +1,3 @@
-import networkx as nx
-import pickle
 from typing import TypedDict, List
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage, SystemMessage
@@ -8,16 +6,17 @@ import sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 import config
-# Reutilizamos tu generador existente, pero lo llamaremos manualmente
-from src.components.generator import client as gemini_client 
+from src.components.context_packer import pack_context
+from src.components.metrics import metrics
+from src.components.graph_store import GraphHolder
 from google.genai import types
 
-# Cargar el grafo creado en la ingestión
-try:
-    with open(config.CHROMA_PERSIST_DIR / "knowledge_graph.gpickle", 'rb') as f:
-        G = pickle.load(f)
-except:
-    G = nx.DiGraph() # Fallback vacío
+# Cargar el grafo creado en la ingestión. El holder lo recarga en caliente cuando se
+# reconstruye el archivo (o con graph_holder.reload()), sin reiniciar el proceso.
+graph_holder = GraphHolder(poll_seconds=config.GRAPH_RELOAD_POLL_SECONDS)
+graph_holder.reload()
+if config.GRAPH_WATCH_ENABLED:
+    graph_holder.start_watching()
 
 # --- 1. DEFINIR EL ESTADO ---
 class AgentState(TypedDict):
@@ -27,30 +26,34 @@ class AgentState(TypedDict):
 
 # --- 2. NODOS DEL GRAFO (Tools) ---
 
-def search_graph_node(state: AgentState):
-    """Busca en el grafo NetworkX navegando por nodos vecinos"""
-    query = state["question"].lower()
+@metrics.timed("graph_search")
+def search_graph(question: str):
+    """
+    Busca en el grafo NetworkX navegando por nodos vecinos.
+    Devuelve los archivos ordenados por número de atributos de la query que comparten.
+    """
+    query = question.lower()
     print(f"🕸️ Agente explorando grafo para: {query}")
     
-    found_files = set()
+    # Tomamos el snapshot UNA vez: si hay una recarga en curso, esta consulta termina con su versión
+    snapshot = graph_holder.get()
+    file_hits = {}
     
     # Lógica de búsqueda en Grafo:
     # 1. Identificar keywords en la query que coincidan con nodos atributos
-    # 2. Viajar de esos atributos a los archivos conectados
+    # 2. Viajar de esos atributos a los archivos conectados (índice precalculado al cargar)
     
-    keywords = [node for node in G.nodes if node in query and G.nodes[node].get('type') != 'file']
+    keywords = [node for node in snapshot.keyword_index if node in query]
     
     for key in keywords:
-        # Obtener vecinos (archivos conectados a este keyword)
-        neighbors = G.neighbors(key)
-        for n in neighbors:
-            if G.nodes[n].get('type') == 'file':
-                found_files.add(n)
+        # Archivos conectados a este keyword
+        for n in snapshot.keyword_index[key]:
+            file_hits[n] = file_hits.get(n, 0) + 1
     
-    # Formatear contexto
+    # Formatear contexto: primero los archivos conectados a más keywords (ranking para la fusión)
     context_list = []
-    for filename in found_files:
-        node_data = G.nodes[filename]
+    for filename in sorted(file_hits, key=lambda f: (-file_hits[f], f)):
+        node_data = snapshot.files[filename]
         context_list.append({
             "filename": filename,
             "description": node_data['description'],
@@ -62,7 +65,11 @@ def search_graph_node(state: AgentState):
         # Fallback: si no encuentra por grafo, devuelve mensaje vacío
         print("⚠️ No se encontraron conexiones en el grafo.")
         
-    return {"context": context_list}
+    return context_list
+
+def search_graph_node(state: AgentState):
+    """Nodo LangGraph: búsqueda en el grafo de conocimiento"""
+    return {"context": search_graph(state["question"])}
 
 def generate_answer_node(state: AgentState):
     """Genera la respuesta usando Gemini con el contexto del grafo"""
@@ -72,16 +79,24 @@ def generate_answer_node(state: AgentState):
     if not context:
         return {"answer": "No encontré información relacionada en el grafo de conocimiento."}
 
+    # El grafo puede devolver decenas de archivos: limitamos vagones y tokens antes de llamar a Gemini
+    context = pack_context(context)
+
     # Preparamos el prompt igual que en tu generador original
     context_text = "\n".join([f"- Archivo {c['filename']}: {c['description']}" for c in context])
     
     # Usamos la imagen del primer resultado
     from PIL import Image
     import PIL
+    # Reutilizamos el cliente del generador existente. Se importa aquí (no al cargar el módulo)
+    # para que search_graph funcione sin credenciales de Gemini (p. ej. lotes solo de recuperación)
+    from src.components.generator import client as gemini_client
     
     try:
         img_path = context[0]['image_path']
-        image = Image.open(img_path)
+        with metrics.span("image_open"):
+            image = Image.open(img_path)
+            image.load()
         
         prompt = f"""
         Pregunta: {query}
@@ -90,13 +105,15 @@ def generate_answer_node(state: AgentState):
         Responde basándote en la imagen y el texto. Indica qué nodo/archivo usaste.
         """
         
-        response = gemini_client.models.generate_content(
-            model=config.GEMINI_MODEL,
-            contents=[image, prompt]
-        )
+        with metrics.span("gemini_generate"):
+            response = gemini_client.models.generate_content(
+                model=config.GEMINI_MODEL,
+                contents=[image, prompt]
+            )
         return {"answer": response.text}
         
     except Exception as e:
+        metrics.inc("generation_errors")
         return {"answer": f"Error generando respuesta: {e}"}
 
 # --- 3. CONSTRUCCIÓN DE LANGGRAPH ---
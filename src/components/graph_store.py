@@ -0,0 +1,331 @@
+# src/components/graph_store.py
+import networkx as nx
+import json
+import pickle
+import threading
+import time
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import config
+from src.components.metrics import metrics
+from src.components.attributes import extract_attributes
+
+
+def get_graph_path():
+    return config.CHROMA_PERSIST_DIR / "knowledge_graph.gpickle"
+
+
+def get_changelog_path(graph_path=None):
+    """Change log append-only que acompaña al pickle: knowledge_graph.changes.jsonl."""
+    return (graph_path or get_graph_path()).with_suffix(".changes.jsonl")
+
+
+# --- OPERACIONES INCREMENTALES SOBRE EL GRAFO ---
+# Las comparten la ingesta (build_graph, compactación) y el servicio (GraphHolder),
+# así un grafo reconstruido y uno actualizado por cambios quedan idénticos.
+
+def _file_attributes(G, filename: str) -> set:
+    return {n for n in G.successors(filename) if G.nodes[n].get('type') != 'file'}
+
+
+def add_file_node(G, filename: str, path: str, description: str) -> set:
+    """
+    Crea o actualiza el nodo de un archivo tocando solo SUS aristas de atributos.
+    Devuelve los atributos afectados (los que tenía y los que tiene ahora).
+    """
+    old_attributes = _file_attributes(G, filename) if filename in G else set()
+    G.add_node(filename, type="file", path=str(path), description=description)
+
+    # El vocabulario vive en src/components/attributes.py y lo comparte la ingesta de ChromaDB
+    attributes = extract_attributes(description)
+    new_attributes = set()
+
+    # -- Colores --
+    for color in attributes["colores"]:
+        G.add_node(color, type="atributo_color")
+        G.add_edge(filename, color, relation="tiene_color")
+        G.add_edge(color, filename, relation="es_color_de")  # Relación inversa para búsqueda
+        new_attributes.add(color)
+
+    # -- Carga/Tipo --
+    for carga in attributes["cargas"]:
+        G.add_node(carga, type="atributo_carga")
+        G.add_edge(filename, carga, relation="transporta_o_es")
+        G.add_edge(carga, filename, relation="transportado_por")
+        new_attributes.add(carga)
+
+    # Atributos que la nueva descripción ya no menciona
+    for attribute in old_attributes - new_attributes:
+        G.remove_edge(filename, attribute)
+        G.remove_edge(attribute, filename)
+        if G.degree(attribute) == 0:
+            G.remove_node(attribute)
+
+    return old_attributes | new_attributes
+
+
+def remove_file_node(G, filename: str) -> set:
+    """Elimina un archivo y los atributos que se quedan sin archivos. Devuelve los atributos afectados."""
+    if filename not in G:
+        return set()
+    attributes = _file_attributes(G, filename)
+    G.remove_node(filename)
+    for attribute in attributes:
+        if G.degree(attribute) == 0:
+            G.remove_node(attribute)
+    return attributes
+
+
+def apply_change(G, change: dict) -> set:
+    """
+    Aplica un registro del change log ({"op": "upsert"|"remove", "filename", ...}).
+    Es idempotente: reaplicar un cambio ya incluido en el pickle no altera el grafo.
+    """
+    if change["op"] == "upsert":
+        return add_file_node(G, change["filename"], change["path"], change["description"])
+    if change["op"] == "remove":
+        return remove_file_node(G, change["filename"])
+    raise ValueError(f"Operación desconocida en el change log: {change['op']}")
+
+
+def read_changelog(path, offset: int = 0):
+    """
+    Lee los cambios a partir de `offset` (bytes). Devuelve (cambios, nuevo_offset, inode).
+    Solo se consumen líneas completas: una escritura a medias se lee en la siguiente pasada.
+    El inode identifica el archivo leído: la compactación y la reconstrucción lo sustituyen.
+    """
+    try:
+        with open(path, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], 0, None
+
+    end = data.rfind(b"\n") + 1
+    changes = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+    return changes, offset + end, inode
+
+
+def replay_changelog(G, path):
+    """
+    Aplica sobre G (recién cargado del pickle) los cambios del log de SU generación.
+
+    La primera línea del log es {"op": "generation", ...} y debe coincidir con
+    G.graph["generation"]. Si no coincide, el log es de otra versión del pickle (p. ej.
+    una reconstrucción a medio publicar) y se ignora entero. Devuelve (offset, inode).
+    """
+    changes, offset, inode = read_changelog(path)
+    generation = G.graph.get("generation")
+    if changes and changes[0]["op"] == "generation":
+        header, changes = changes[0], changes[1:]
+        if header["generation"] != generation:
+            return offset, inode
+    elif generation is not None:
+        # Log sin cabecera frente a un pickle con generación: no se sabe a qué versión pertenece
+        return offset, inode
+
+    for change in changes:
+        apply_change(G, change)
+    return offset, inode
+
+
+class GraphSnapshot:
+    """
+    Versión INMUTABLE del grafo lista para servir consultas.
+
+    Además del grafo guarda los índices que usa la búsqueda, precalculados al cargar:
+        - files: filename -> {"description", "path"}
+        - keyword_index: atributo -> tupla de filenames conectados
+    Nadie modifica un snapshot publicado: una recarga construye uno nuevo y lo sustituye.
+
+    Con `base`, los índices se copian del snapshot anterior y solo se recalculan las
+    entradas de `filenames` y `attributes` (cambios del change log). En ese caso `graph`
+    es el grafo de trabajo del holder, que sigue cambiando: las consultas usan los índices.
+    """
+
+    def __init__(self, graph, version: int = 0, mtime: int = None, log_offset: int = 0,
+                 log_inode: int = None, base=None, filenames=(), attributes=()):
+        self.graph = graph
+        self.version = version
+        self.mtime = mtime
+        self.log_offset = log_offset
+        self.log_inode = log_inode
+        self.loaded_at = time.time()
+
+        if base is None:
+            self._build_indexes(graph)
+        else:
+            self._patch_indexes(graph, base, filenames, attributes)
+
+    def _build_indexes(self, graph):
+        self.files = {}
+        for node, data in graph.nodes(data=True):
+            if data.get('type') == 'file':
+                self.files[node] = {"description": data['description'], "path": data['path']}
+
+        self.keyword_index = {}
+        for node, data in graph.nodes(data=True):
+            if data.get('type') != 'file':
+                self.keyword_index[node] = tuple(n for n in graph.neighbors(node) if n in self.files)
+
+    def _patch_indexes(self, graph, base, filenames, attributes):
+        # Copia superficial de los índices: el snapshot anterior sigue intacto para las consultas en curso
+        self.files = dict(base.files)
+        for filename in filenames:
+            data = graph.nodes.get(filename)
+            if data is not None and data.get('type') == 'file':
+                self.files[filename] = {"description": data['description'], "path": data['path']}
+            else:
+                self.files.pop(filename, None)
+
+        self.keyword_index = dict(base.keyword_index)
+        for attribute in attributes:
+            if attribute in graph:
+                self.keyword_index[attribute] = tuple(n for n in graph.neighbors(attribute) if n in self.files)
+            else:
+                self.keyword_index.pop(attribute, None)
+
+
+class GraphHolder:
+    """
+    Mantiene el snapshot actual del grafo y lo recarga sin cortar el servicio.
+
+    - get() devuelve el snapshot vigente (una lectura de referencia, atómica en CPython).
+      Una petición que ya tomó su snapshot termina con él aunque se publique otro.
+    - reload() carga el pickle, reaplica el change log y construye los índices FUERA del
+      camino de las consultas; solo al final sustituye la referencia.
+    - refresh() aplica únicamente los cambios nuevos del change log (desde el último offset)
+      y publica un snapshot que solo recalcula las entradas afectadas. Si cambió el pickle
+      (reconstrucción o compactación) hace una recarga completa.
+    - start_watching() lanza un hilo que llama a refresh() periódicamente.
+    Si una recarga falla, se informa y se sigue sirviendo la versión anterior.
+    """
+
+    def __init__(self, path=None, poll_seconds: float = 2.0):
+        self.path = path or get_graph_path()
+        self.changelog_path = get_changelog_path(self.path)
+        self.poll_seconds = poll_seconds
+        # Grafo de trabajo: solo se modifica con _reload_lock tomado
+        self._graph = nx.DiGraph()
+        self._snapshot = GraphSnapshot(self._graph)
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self._failed_mtime = None
+
+    def get(self) -> GraphSnapshot:
+        return self._snapshot
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _changelog_stat(self):
+        try:
+            stat = os.stat(self.changelog_path)
+            return stat.st_size, stat.st_ino
+        except OSError:
+            return 0, None
+
+    def reload(self, force: bool = False) -> bool:
+        """Carga el grafo del disco y publica un nuevo snapshot. Devuelve True si cambió de versión."""
+        with self._reload_lock:
+            return self._reload_locked(force)
+
+    def _reload_locked(self, force: bool) -> bool:
+        mtime = self._file_mtime()
+        if mtime is None:
+            print(f"⚠️ No existe el grafo en {self.path}. Se sirve un grafo vacío hasta que se construya.")
+            return False
+        if not force and mtime == self._snapshot.mtime:
+            return False
+
+        try:
+            with metrics.span("graph_reload"):
+                with open(self.path, 'rb') as f:
+                    graph = pickle.load(f)
+                # Cambios aún no compactados en el pickle (solo los de su misma generación)
+                log_offset, log_inode = replay_changelog(graph, self.changelog_path)
+                snapshot = GraphSnapshot(graph, version=self._snapshot.version + 1, mtime=mtime,
+                                         log_offset=log_offset, log_inode=log_inode)
+        except Exception as e:
+            # Archivo a medias o corrupto: se mantiene la versión anterior y se reintenta cuando cambie el archivo
+            metrics.inc("graph_reload_errors")
+            self._failed_mtime = mtime
+            print(f"❌ Error recargando el grafo ({e}). Se mantiene la versión {self._snapshot.version}.")
+            return False
+
+        # Publicación atómica: las nuevas consultas ven la versión nueva, las que están en curso terminan con la suya
+        self._graph = graph
+        self._snapshot = snapshot
+        metrics.inc("graph_reloads")
+        print(f"🔄 Grafo cargado (versión {snapshot.version}): {len(snapshot.files)} archivos, {len(snapshot.keyword_index)} atributos.")
+        return True
+
+    def refresh(self) -> bool:
+        """Publica lo nuevo del disco con el menor trabajo posible. Devuelve True si cambió de versión."""
+        with self._reload_lock:
+            mtime = self._file_mtime()
+            if mtime is not None and mtime not in (self._snapshot.mtime, self._failed_mtime):
+                return self._reload_locked(force=False)
+
+            size, inode = self._changelog_stat()
+            if inode != self._snapshot.log_inode or size < self._snapshot.log_offset:
+                # El log se sustituyó (compactación/reconstrucción): recarga completa
+                return self._reload_locked(force=True)
+            if size == self._snapshot.log_offset:
+                return False
+            return self._apply_changelog_locked()
+
+    def _apply_changelog_locked(self) -> bool:
+        base = self._snapshot
+        try:
+            with metrics.span("graph_apply_changes"):
+                changes, log_offset, log_inode = read_changelog(self.changelog_path, base.log_offset)
+                if log_inode != base.log_inode:
+                    return self._reload_locked(force=True)
+                if not changes:
+                    return False  # Solo hay una línea a medias: se lee en la siguiente pasada
+                filenames, attributes = set(), set()
+                for change in changes:
+                    attributes |= apply_change(self._graph, change)
+                    filenames.add(change["filename"])
+                snapshot = GraphSnapshot(self._graph, version=base.version + 1, mtime=base.mtime,
+                                         log_offset=log_offset, log_inode=log_inode, base=base,
+                                         filenames=filenames, attributes=attributes)
+        except Exception as e:
+            # El grafo de trabajo pudo quedar a medias: se reconstruye entero desde el disco
+            metrics.inc("graph_reload_errors")
+            print(f"❌ Error aplicando el change log del grafo ({e}). Recargando completo...")
+            return self._reload_locked(force=True)
+
+        self._snapshot = snapshot
+        metrics.inc("graph_incremental_updates")
+        metrics.inc("graph_changes_applied", len(changes))
+        print(f"🔄 Grafo actualizado (versión {snapshot.version}): {len(changes)} cambios, {len(filenames)} archivos afectados.")
+        return True
+
+    def reload_async(self):
+        """Recarga en un hilo en segundo plano (no bloquea al llamador)."""
+        thread = threading.Thread(target=self.reload, kwargs={"force": True}, name="graph-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            self.refresh()
+
+    def start_watching(self):
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="graph-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
@@ -0,0 +1,133 @@
+# src/components/hybrid_agent.py
+from typing import TypedDict, List
+from langgraph.graph import StateGraph, START, END
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import config
+from src.components.retriever import search_chroma
+from src.components.graph_agent import search_graph, generate_answer_node
+
+# --- 1. DEFINIR EL ESTADO ---
+class HybridState(TypedDict):
+    question: str
+    vector_context: List[dict]
+    graph_context: List[dict]
+    context: List[dict]
+    answer: str
+    n_results: int  # Opcional: archivos a devolver (por defecto config.HYBRID_N_RESULTS)
+
+
+def reciprocal_rank_fusion(result_lists: List[List[dict]], k: int = 60, n_results: int = None):
+    """
+    Fusiona varias listas de contexto con Reciprocal Rank Fusion (RRF).
+
+    Cada archivo suma 1 / (k + rank) por cada lista en la que aparece. Si un archivo
+    aparece varias veces en la misma lista (varios chunks), solo cuenta su mejor rank.
+
+    Args:
+        result_lists (list): Listas de diccionarios de contexto, ordenadas por relevancia.
+        k (int): Constante de suavizado de RRF.
+        n_results (int): Máximo de archivos a devolver (None = todos).
+
+    Returns:
+        list: Contexto deduplicado por 'filename' y ordenado por score RRF.
+    """
+    scores = {}
+    best_items = {}
+
+    for results in result_lists:
+        seen = set()
+        for item in results:
+            filename = item['filename']
+            if filename in seen:
+                continue
+            seen.add(filename)
+
+            rank = len(seen)
+            scores[filename] = scores.get(filename, 0.0) + 1.0 / (k + rank)
+
+            # Nos quedamos con la descripción más completa del archivo (texto completo del grafo > chunk)
+            current = best_items.get(filename)
+            if current is None or len(item.get('description', '')) > len(current.get('description', '')):
+                best_items[filename] = item
+
+    # Score máximo posible: primer puesto en todas las listas. Se usa para normalizar a [0, 1]
+    max_score = len(result_lists) / (k + 1) if result_lists else 1.0
+
+    fused = []
+    for filename in sorted(scores, key=lambda f: (-scores[f], f)):
+        fused.append(dict(best_items[filename], relevance_score=scores[filename] / max_score))
+
+    return fused[:n_results] if n_results else fused
+
+
+# --- 2. NODOS DEL GRAFO ---
+
+def search_vector_branch(state: HybridState):
+    """Rama vectorial: búsqueda CLIP en ChromaDB"""
+    return {"vector_context": search_chroma(state["question"], n_results=state.get("n_results") or config.HYBRID_N_RESULTS)}
+
+
+def search_graph_branch(state: HybridState):
+    """Rama de grafo: búsqueda por atributos en NetworkX"""
+    return {"graph_context": search_graph(state["question"])}
+
+
+def fuse_results_node(state: HybridState):
+    """Combina ambas ramas con RRF. Si el grafo no encontró nada, usa directamente el resultado vectorial."""
+    vector_context = state.get("vector_context") or []
+    graph_context = state.get("graph_context") or []
+
+    if not graph_context:
+        print("↪️ Grafo sin resultados: se usa el resultado vectorial.")
+        return {"context": vector_context[:state.get("n_results") or config.HYBRID_N_RESULTS]}
+
+    fused = reciprocal_rank_fusion(
+        [vector_context, graph_context],
+        k=config.HYBRID_RRF_K,
+        n_results=state.get("n_results") or config.HYBRID_N_RESULTS
+    )
+    print(f"🔀 Fusión RRF: {len(fused)} archivos únicos.")
+    return {"context": fused}
+
+
+# --- 3. CONSTRUCCIÓN DE LANGGRAPH ---
+def build_hybrid_workflow(with_generation: bool = True):
+    """
+    Construye el flujo híbrido: las dos búsquedas salen de START como ramas paralelas
+    (mismo superstep de LangGraph) y 'fuse' espera a ambas antes de continuar.
+    """
+    workflow = StateGraph(HybridState)
+
+    workflow.add_node("search_chroma", search_vector_branch)
+    workflow.add_node("search_graph", search_graph_branch)
+    workflow.add_node("fuse", fuse_results_node)
+
+    workflow.add_edge(START, "search_chroma")
+    workflow.add_edge(START, "search_graph")
+    workflow.add_edge(["search_chroma", "search_graph"], "fuse")
+
+    if with_generation:
+        workflow.add_node("generate", generate_answer_node)
+        workflow.add_edge("fuse", "generate")
+        workflow.add_edge("generate", END)
+    else:
+        workflow.add_edge("fuse", END)
+
+    return workflow.compile()
+
+
+# Compilar aplicaciones: completa (búsqueda + Gemini) y solo recuperación
+hybrid_app = build_hybrid_workflow(with_generation=True)
+hybrid_retrieval_app = build_hybrid_workflow(with_generation=False)
+
+
+def hybrid_search(question: str, n_results: int = None):
+    """Ejecuta solo la recuperación híbrida y devuelve la lista de contexto fusionada (máximo `n_results` archivos)."""
+    result_state = hybrid_retrieval_app.invoke({
+        "question": question, "vector_context": [], "graph_context": [], "context": [], "answer": "",
+        "n_results": n_results or config.HYBRID_N_RESULTS
+    })
+    return result_state.get("context", [])
@@ -0,0 +1,242 @@
+# src/components/metrics.py
+import json
+import threading
+import time
+from collections import deque
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import config
+
+# Límites (en segundos) de los buckets de los histogramas de latencia
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Límites para distribuciones de tamaños (lotes, profundidad de cola)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class Histogram:
+    """Histograma acumulativo al estilo Prometheus (buckets fijos + suma + conteo)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.bucket_counts[i] += 1
+                break
+
+    def cumulative_counts(self):
+        total = 0
+        for count in self.bucket_counts:
+            total += count
+            yield total
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": {str(upper): cumulative for upper, cumulative in zip(self.buckets, self.cumulative_counts())},
+        }
+
+
+class _NullSpan:
+    """Span vacío que se devuelve cuando las métricas están desactivadas (coste ~0)."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, registry, stage: str):
+        self.registry = registry
+        self.stage = stage
+        self.parent = None
+        self.start = 0.0
+
+    def __enter__(self):
+        stack = self.registry._stack()
+        self.parent = stack[-1].stage if stack else None
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        self.registry._stack().pop()
+        self.registry._finish_span(self, duration, failed=exc_type is not None)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Registro de spans, histogramas de latencia por etapa y contadores de eventos.
+
+    Uso:
+        with metrics.span("chroma_query"):
+            ...
+        metrics.inc("chroma_collection_cache_hit")
+
+    Cuando está desactivado, span() devuelve un context manager vacío compartido e
+    inc()/observe() retornan de inmediato.
+    """
+
+    def __init__(self, enabled: bool = False, max_recent_spans: int = 1000):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._histograms = {}
+        self._counters = {}
+        self._distributions = {}
+        self._gauges = {}
+        self._recent_spans = deque(maxlen=max_recent_spans)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, stage: str):
+        """Mide la duración del bloque y la registra en el histograma de `stage`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, stage)
+
+    def timed(self, stage: str):
+        """Decorador equivalente a envolver la función en `span(stage)`."""
+        def decorator(func):
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+        return decorator
+
+    def _finish_span(self, span: _Span, duration: float, failed: bool):
+        with self._lock:
+            self._observe_locked(span.stage, duration)
+            if failed:
+                self._counters[f"{span.stage}_errors"] = self._counters.get(f"{span.stage}_errors", 0) + 1
+            self._recent_spans.append({
+                "stage": span.stage,
+                "parent": span.parent,
+                "thread": threading.current_thread().name,
+                "duration_s": duration,
+                "error": failed,
+            })
+
+    def _observe_locked(self, stage: str, value: float):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            histogram = self._histograms[stage] = Histogram()
+        histogram.observe(value)
+
+    def observe(self, stage: str, seconds: float):
+        """Registra manualmente una latencia (en segundos) para `stage`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._observe_locked(stage, seconds)
+
+    def inc(self, event: str, value: int = 1):
+        """Incrementa el contador `event` (aciertos de caché, errores, ...)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + value
+
+    def observe_value(self, name: str, value: float, buckets=SIZE_BUCKETS):
+        """Registra un valor que no es una latencia (tamaño de lote, profundidad de cola...)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._distributions.get(name)
+            if histogram is None:
+                histogram = self._distributions[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def set_gauge(self, name: str, value: float):
+        """Fija el valor actual de `name` (p. ej. la profundidad de una cola)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[name] = value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._distributions.clear()
+            self._gauges.clear()
+            self._recent_spans.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {stage: h.to_dict() for stage, h in sorted(self._histograms.items())},
+                "counters": dict(sorted(self._counters.items())),
+                "distributions": {name: h.to_dict() for name, h in sorted(self._distributions.items())},
+                "gauges": dict(sorted(self._gauges.items())),
+                "recent_spans": list(self._recent_spans),
+            }
+
+    def export_json(self, indent: int = 2) -> str:
+        return json.dumps(self.snapshot(), indent=indent, ensure_ascii=False)
+
+    def export_prometheus(self, prefix: str = "rag") -> str:
+        """Formato de exposición de texto de Prometheus."""
+        lines = [
+            f"# HELP {prefix}_stage_seconds Latencia por etapa del pipeline RAG.",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, h in sorted(self._histograms.items()):
+                for upper, cumulative in zip(h.buckets, h.cumulative_counts()):
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{upper}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {h.sum}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {h.count}')
+
+            lines.append(f"# HELP {prefix}_events_total Contadores de eventos (caché, errores).")
+            lines.append(f"# TYPE {prefix}_events_total counter")
+            for event, value in sorted(self._counters.items()):
+                lines.append(f'{prefix}_events_total{{event="{event}"}} {value}')
+
+            lines.append(f"# HELP {prefix}_distribution Distribuciones de tamaños (lotes, colas).")
+            lines.append(f"# TYPE {prefix}_distribution histogram")
+            for name, h in sorted(self._distributions.items()):
+                for upper, cumulative in zip(h.buckets, h.cumulative_counts()):
+                    lines.append(f'{prefix}_distribution_bucket{{name="{name}",le="{upper}"}} {cumulative}')
+                lines.append(f'{prefix}_distribution_bucket{{name="{name}",le="+Inf"}} {h.count}')
+                lines.append(f'{prefix}_distribution_sum{{name="{name}"}} {h.sum}')
+                lines.append(f'{prefix}_distribution_count{{name="{name}"}} {h.count}')
+
+            lines.append(f"# HELP {prefix}_gauge Valores actuales (profundidad de colas).")
+            lines.append(f"# TYPE {prefix}_gauge gauge")
+            for name, value in sorted(self._gauges.items()):
+                lines.append(f'{prefix}_gauge{{name="{name}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+
+# Registro global del proceso (activar con RAG_METRICS=1)
+metrics = MetricsRegistry(enabled=config.METRICS_ENABLED)
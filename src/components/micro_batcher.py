@@ -0,0 +1,137 @@
+# src/components/micro_batcher.py
+import threading
+import queue
+import time
+import os
+import sys
+from concurrent.futures import Future
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.components.metrics import metrics
+
+
+class MicroBatcher:
+    """
+    Agrupa peticiones concurrentes en lotes antes de llamar a una función vectorizada.
+
+    Cada llamador envía UN elemento y recibe SU resultado; el hilo de trabajo junta
+    los elementos que lleguen durante `max_wait_ms` (o hasta `max_batch_size`) y
+    ejecuta `batch_fn` una sola vez para todo el lote.
+
+    Args:
+        batch_fn (callable): Recibe una lista de elementos y devuelve una lista de
+            resultados en el mismo orden.
+        max_batch_size (int): Tamaño máximo de lote.
+        max_wait_ms (float): Tiempo máximo que se espera a más peticiones tras la primera.
+        name (str): Nombre del hilo (útil para depurar) y prefijo de sus métricas en
+            el registro global (`<name>_batch_size`, `<name>_queue_depth`, ...).
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int = 32, max_wait_ms: float = 5.0, name: str = "micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self.metric_prefix = name.replace("-", "_")
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+
+        # Métricas
+        self._max_queue_depth = 0
+        self._batches_total = 0
+        self._items_total = 0
+        self._errors_total = 0
+        self._batch_size_histogram = {}
+
+    def _ensure_worker(self):
+        # El hilo se arranca en la primera petición (no al importar el módulo)
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def submit(self, item) -> Future:
+        """Encola un elemento y devuelve un Future con su resultado individual."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+
+        depth = self._queue.qsize()
+        with self._metrics_lock:
+            if depth > self._max_queue_depth:
+                self._max_queue_depth = depth
+        metrics.observe_value(f"{self.metric_prefix}_queue_depth", depth)
+        metrics.set_gauge(f"{self.metric_prefix}_queue_depth", depth)
+        return future
+
+    def __call__(self, item, timeout: float = None):
+        """Atajo síncrono: encola el elemento y espera su resultado."""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect_batch(self):
+        # Bloquea hasta la primera petición y luego junta las que lleguen dentro de la ventana
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_s
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # Un Future cancelado por el llamador no se procesa
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            metrics.observe_value(f"{self.metric_prefix}_batch_size", len(items))
+            metrics.set_gauge(f"{self.metric_prefix}_queue_depth", self._queue.qsize())
+            metrics.inc(f"{self.metric_prefix}_batches")
+            metrics.inc(f"{self.metric_prefix}_items", len(items))
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"batch_fn devolvió {len(results)} resultados para {len(items)} elementos.")
+            except Exception as e:
+                with self._metrics_lock:
+                    self._errors_total += 1
+                metrics.inc(f"{self.metric_prefix}_errors")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                with self._metrics_lock:
+                    self._batches_total += 1
+                    self._items_total += len(items)
+                    self._batch_size_histogram[len(items)] = self._batch_size_histogram.get(len(items), 0) + 1
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def get_metrics(self) -> dict:
+        """Devuelve profundidad de cola y distribución de tamaños de lote."""
+        with self._metrics_lock:
+            avg_batch = self._items_total / self._batches_total if self._batches_total else 0.0
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches_total": self._batches_total,
+                "items_total": self._items_total,
+                "errors_total": self._errors_total,
+                "avg_batch_size": avg_batch,
+                "batch_size_histogram": dict(sorted(self._batch_size_histogram.items())),
+            }
@@ -9,6 +9,12 @@ import sys
 # Añadir el directorio raíz al path para importar config
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 import config
+from src.components.micro_batcher import MicroBatcher
+from src.components.context_packer import group_by_file
+from src.components.metrics import metrics
+from src.components.embedding_codec import EmbeddingCodec
+from src.components.attributes import build_where_filter
+from src.components.sharding import get_sharded_searcher
 
 # Inicializar componentes CLIP (mismo modelo Large que en la ingesta)
 MODEL_NAME = config.CLIP_MODEL_NAME
@@ -17,40 +23,151 @@ model = CLIPModel.from_pretrained(MODEL_NAME)
 processor = CLIPProcessor.from_pretrained(MODEL_NAME)
 
 
+def texts_to_clip_embeddings(texts: list):
+    """
+    Convierte un LOTE de textos en vectores CLIP NORMALIZADOS con una sola pasada del modelo.
+    Devuelve una lista de vectores en el mismo orden que los textos de entrada.
+    """
+    with metrics.span("clip_text_encode"):
+        inputs = processor(text=list(texts), images=None, return_tensors="pt", padding=True, truncation=True, max_length=config.CLIP_MAX_TOKENS)
+
+        with torch.no_grad():
+            text_features = model.get_text_features(**inputs)
+            # Normalización por fila: cada query conserva su propio vector unitario
+            text_features = text_features / text_features.norm(p=2, dim=-1, keepdim=True)
+
+        return text_features.tolist()
+
+
+# Scheduler que agrupa las queries concurrentes delante del encoder de texto
+query_batcher = MicroBatcher(
+    texts_to_clip_embeddings,
+    max_batch_size=config.QUERY_BATCH_MAX_SIZE,
+    max_wait_ms=config.QUERY_BATCH_MAX_WAIT_MS,
+    name="clip-text-batcher"
+)
+
+
 def text_to_clip_embedding(text: str):
     """
     Convierte un texto (query) en un vector CLIP NORMALIZADO.
     Esto es crucial para que coincida con los vectores normalizados de la ingesta.
+    Si el micro-batching está activo, la query se agrupa con las demás queries concurrentes.
     """
     try:
-        # Procesar solo texto
-        inputs = processor(text=[text], images=None, return_tensors="pt", padding=True)
-        
-        with torch.no_grad():
-            # Obtener features
-            text_features = model.get_text_features(**inputs)
-            
-            # --- PASO CLAVE: NORMALIZACIÓN ---
-            # Esto alinea la magnitud del vector con los almacenados en ChromaDB
-            text_features = text_features / text_features.norm(p=2, dim=-1, keepdim=True)
-        
-        return text_features.squeeze().tolist()
+        # Latencia por petición, incluida la espera en la cola del micro-batcher
+        # (clip_text_encode mide solo la pasada del modelo, una vez por lote)
+        with metrics.span("clip_query_encode"):
+            if config.QUERY_BATCH_ENABLED:
+                return query_batcher(text)
+            return texts_to_clip_embeddings([text])[0]
     except Exception as e:
+        metrics.inc("clip_text_encode_errors")
         print(f"Error generando embedding para query: {e}")
         return []
 
 
+# Colección de ChromaDB reutilizada entre búsquedas (abrir el cliente persistente es costoso)
+_collection = None
+# Codec de almacenamiento (PCA/cuantización) con el que se ingirió la colección
+_codec = None
+
+
+def get_collection():
+    """
+    Devuelve la colección cacheada o abre una nueva conexión a ChromaDB.
+    Con CHROMA_NUM_SHARDS > 1 devuelve el coordinador scatter-gather (misma interfaz count/query).
+    """
+    global _collection
+    if config.CHROMA_NUM_SHARDS > 1:
+        return get_sharded_searcher()
+    if _collection is not None:
+        metrics.inc("chroma_collection_cache_hit")
+        return _collection
+
+    metrics.inc("chroma_collection_cache_miss")
+    client = chromadb.PersistentClient(path=str(config.CHROMA_PERSIST_DIR))
+    _collection = client.get_collection(name=config.CHROMA_COLLECTION_NAME)
+    return _collection
+
+
+def get_codec():
+    """
+    Devuelve el codec guardado por la ingesta (o float32 si la colección es anterior).
+    En modo PCA, la query debe proyectarse con la misma matriz que el corpus.
+    """
+    global _codec
+    if _codec is None:
+        codec_path = config.CHROMA_PERSIST_DIR / config.EMBEDDING_CODEC_FILENAME
+        _codec = EmbeddingCodec.load(codec_path) if codec_path.exists() else EmbeddingCodec("float32")
+    return _codec
+
+
+def reset_collection_cache():
+    """Invalida la colección y el codec cacheados (p. ej. tras una re-ingesta en el mismo proceso)."""
+    global _collection, _codec
+    _collection = None
+    _codec = None
+
+
+def query_chunks(collection, query_vector: list, n_fetch: int, where: dict = None):
+    """Ejecuta la consulta vectorial (opcionalmente filtrada) y devuelve los chunks formateados."""
+    with metrics.span("chroma_query"):
+        results = collection.query(
+            query_embeddings=[query_vector],
+            n_results=n_fetch,
+            where=where,
+            include=['metadatas', 'documents', 'distances']
+        )
+
+    context_list = []
+    if results['ids']:
+        # Los resultados vienen anidados, iteramos sobre el primer (y único) query
+        for metadata, document, distance in zip(results['metadatas'][0], results['documents'][0], results['distances'][0]):
+            
+            # Convertir distancia (L2 o Cosine) a un score de relevancia aproximado (0 a 1)
+            # Nota: ChromaDB por defecto usa L2 (Euclidean Squared). 
+            # Distancias más bajas = Mayor similitud.
+            relevance = max(0, 1 - distance) 
+
+            context_list.append({
+                "filename": metadata['filename'],
+                "description": document,
+                "relevance_score": relevance,
+                "image_path": str(config.IMAGE_DIR / metadata['filename'])
+            })
+    return context_list
+
+
+def fetch_distinct_files(collection, query_vector: list, n_results: int, total: int, where: dict = None):
+    """
+    Sobre-recupera chunks hasta cubrir `n_results` archivos distintos.
+
+    Empieza pidiendo n_results * CHROMA_OVERFETCH_FACTOR chunks y duplica la petición
+    mientras los chunks se concentren en menos archivos de los pedidos, hasta agotar la
+    colección (o los candidatos que pasan el filtro `where`).
+    """
+    n_fetch = max(n_results, min(n_results * config.CHROMA_OVERFETCH_FACTOR, total))
+    while True:
+        chunks = query_chunks(collection, query_vector, n_fetch, where=where)
+        if len(group_by_file(chunks)) >= n_results or n_fetch >= total or len(chunks) < n_fetch:
+            return chunks
+        metrics.inc("chroma_overfetch_retries")
+        n_fetch = min(n_fetch * 2, total)
+
+
 def search_chroma(query_text: str, n_results: int = 3):
     """
     Busca los embeddings multimodales más cercanos al vector del query textual.
+    Devuelve hasta n_results vagones DISTINTOS: se sobre-recuperan chunks y se agrupan por archivo.
     """
     print(f"🔍 Buscando '{query_text}' en ChromaDB...")
     
     # 1. Conexión a ChromaDB
     try:
-        client = chromadb.PersistentClient(path=str(config.CHROMA_PERSIST_DIR))
-        collection = client.get_collection(name=config.CHROMA_COLLECTION_NAME)
+        collection = get_collection()
     except Exception as e:
+        metrics.inc("chroma_connection_errors")
         print(f"❌ Error de conexión: Asegúrate de haber ejecutado la ingesta primero.\nDetalle: {e}")
         return []
 
@@ -61,37 +178,39 @@ def search_chroma(query_text: str, n_results: int = 3):
         print("❌ No se pudo generar el vector de búsqueda.")
         return []
 
+    # Misma transformación que el corpus (proyección PCA si aplica)
+    query_vector = get_codec().encode_query(query_vector)
+
     # 3. Ejecutar la búsqueda vectorial
-    # Usamos query_embeddings para comparar vector vs vector (768 dimensiones)
+    # Usamos query_embeddings para comparar vector vs vector (768 dimensiones, o las de la PCA)
+    # Pedimos más chunks de los necesarios (y más aún si hace falta) porque varios pueden ser del mismo archivo
+    # Si la query menciona colores/cargas, se filtra primero por metadatos (candidatos más pocos y más precisos)
+    where = build_where_filter(query_text) if config.CHROMA_METADATA_PREFILTER else None
     try:
-        results = collection.query(
-            query_embeddings=[query_vector],
-            n_results=n_results,
-            include=['metadatas', 'documents', 'distances']
-        )
+        total = collection.count()
+        chunks = fetch_distinct_files(collection, query_vector, n_results, total, where=where) if where else []
+        context_list = group_by_file(chunks)
+
+        if where:
+            print(f"🏷️ Pre-filtro por atributos: {where} -> {len(context_list)} archivos.")
+            metrics.inc("chroma_prefilter_used")
+
+        if len(context_list) < n_results:
+            # Sin filtro o filtro demasiado estricto: completar con la búsqueda sobre toda la colección
+            if where:
+                metrics.inc("chroma_prefilter_fallback")
+            chunks += fetch_distinct_files(collection, query_vector, n_results, total)
+            context_list = group_by_file(chunks)
     except Exception as e:
+        # La colección cacheada puede haber sido borrada por una re-ingesta
+        reset_collection_cache()
         print(f"❌ Error durante la consulta a ChromaDB: {e}")
         return []
     
-    # 4. Formatear el contexto recuperado
-    context_list = []
-    
-    if results['ids']:
-        # Los resultados vienen anidados, iteramos sobre el primer (y único) query
-        for metadata, document, distance in zip(results['metadatas'][0], results['documents'][0], results['distances'][0]):
-            
-            # Convertir distancia (L2 o Cosine) a un score de relevancia aproximado (0 a 1)
-            # Nota: ChromaDB por defecto usa L2 (Euclidean Squared). 
-            # Distancias más bajas = Mayor similitud.
-            relevance = max(0, 1 - distance) 
+    # 4. Un resultado por vagón, hasta completar n_results archivos distintos
+    context_list = context_list[:n_results]
 
-            context_list.append({
-                "filename": metadata['filename'],
-                "description": document,
-                "relevance_score": relevance,
-                "image_path": str(config.IMAGE_DIR / metadata['filename'])
-            })
-            
+    if context_list:
         print(f"✅ Recuperados {len(context_list)} resultados.")
     else:
         print("⚠️ No se encontraron resultados.")
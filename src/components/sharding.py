@@ -0,0 +1,332 @@
+# src/components/sharding.py
+import atexit
+import hashlib
+import itertools
+import subprocess
+import sys
+import threading
+import time
+import os
+from concurrent.futures import Future, wait
+from multiprocessing.connection import Client, Listener
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import config
+from src.components.metrics import metrics
+
+# El total de chunks cambia poco: se cachea unos segundos para no hacer un scatter extra por query
+COUNT_CACHE_TTL_S = 5.0
+# Tiempo máximo para que un shard arranque (intérprete nuevo + import de chromadb + apertura del índice)
+SHARD_STARTUP_TIMEOUT_S = 120.0
+# Clave de autenticación de la conexión coordinador <-> shard (se pasa por entorno, no por argv)
+AUTHKEY_ENV = "RAG_SHARD_AUTHKEY"
+READY_MARKER = "SHARD_READY"
+
+
+def shard_for(filename: str, num_shards: int) -> int:
+    """Shard de un archivo: hash estable (md5) del filename, igual en todos los procesos."""
+    digest = hashlib.md5(filename.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def shard_persist_dir(shard: int):
+    """Directorio del PersistentClient de cada shard."""
+    return config.CHROMA_PERSIST_DIR / f"shard_{shard:02d}"
+
+
+# --- PROCESO TRABAJADOR (uno por shard) ---
+
+def shard_worker(shard: int, client, collection_name: str, conn):
+    """
+    Sirve las consultas de UN shard. Cada proceso es un intérprete nuevo que solo importa
+    chromadb y abre su propio PersistentClient, de modo que cada shard usa su propio núcleo
+    y su propio disco sin heredar hilos ni estado de chromadb/torch del coordinador.
+    """
+    collection = None
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        kind, request_id, deadline, payload = message
+
+        # El coordinador ya dio esta petición por perdida: no se acumula trabajo atrasado
+        if time.time() > deadline:
+            continue
+
+        try:
+            if collection is None:
+                collection = client.get_collection(name=collection_name)
+
+            if kind == "count":
+                result = collection.count()
+            else:
+                # No pedir más resultados que elementos tenga el shard
+                n_results = max(1, min(payload["n_results"], collection.count()))
+                result = collection.query(
+                    query_embeddings=payload["query_embeddings"],
+                    n_results=n_results,
+                    where=payload.get("where"),
+                    include=payload["include"]
+                )
+            conn.send((request_id, shard, result, None))
+        except Exception as e:
+            # La colección puede haberse recreado (re-ingesta): se reabre en la siguiente petición
+            collection = None
+            conn.send((request_id, shard, None, f"{type(e).__name__}: {e}"))
+
+
+def run_shard_process(shard: int, persist_dir: str, collection_name: str):
+    """Punto de entrada del proceso: publica la dirección de escucha y atiende al coordinador."""
+    import chromadb
+
+    # El cliente se abre ANTES de anunciarse: la primera consulta no paga el arranque
+    client = chromadb.PersistentClient(path=persist_dir)
+    listener = Listener(authkey=bytes.fromhex(os.environ[AUTHKEY_ENV]))
+    print(f"{READY_MARKER} {listener.address}", flush=True)
+    # Lo que se imprima después (avisos de chromadb) va a stderr: nadie lee ya el stdout
+    os.dup2(2, 1)
+    with listener.accept() as conn:
+        listener.close()
+        shard_worker(shard, client, collection_name, conn)
+
+
+# --- COORDINADOR ---
+
+class _ShardHandle:
+    """Proceso de un shard y su conexión (None hasta que el proceso está listo)."""
+
+    def __init__(self, process):
+        self.process = process
+        self.conn = None
+        self.ready = threading.Event()
+        self.send_lock = threading.Lock()
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+
+class ShardedSearcher:
+    """
+    Coordinador scatter-gather sobre N shards de ChromaDB.
+
+    Expone `count()` y `query()` con la misma forma que una colección de ChromaDB, así
+    el retriever lo usa sin cambios. Cada consulta se envía a todos los shards, se espera
+    como mucho `timeout_s` y se mezclan los top-k por distancia. Un shard lento o caído
+    no bloquea la búsqueda: su parte simplemente no entra en el resultado.
+    """
+
+    def __init__(self, num_shards: int, collection_name: str, timeout_s: float = 2.0):
+        self.num_shards = num_shards
+        self.collection_name = collection_name
+        self.timeout_s = timeout_s
+
+        self._authkey = os.urandom(32)
+        self._handles = [None] * num_shards
+        self._restart_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._count_cache = (0.0, None)
+
+        for shard in range(num_shards):
+            self._start_worker(shard)
+        # Solo el arranque inicial espera: un shard que se reinicia después se omite hasta estar listo
+        deadline = time.monotonic() + SHARD_STARTUP_TIMEOUT_S
+        for shard, handle in enumerate(self._handles):
+            if not handle.ready.wait(max(0.0, deadline - time.monotonic())):
+                print(f"⚠️ Shard {shard} no arrancó en {SHARD_STARTUP_TIMEOUT_S}s.")
+        atexit.register(self.close)
+
+    def _start_worker(self, shard: int):
+        # Intérprete nuevo (no fork): el coordinador ya tiene CLIP, hilos y clientes de chromadb abiertos.
+        # El script es este módulo, que no importa el retriever ni torch.
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(shard),
+             str(shard_persist_dir(shard)), self.collection_name],
+            stdout=subprocess.PIPE,
+            env={**os.environ, AUTHKEY_ENV: self._authkey.hex()},
+            text=True
+        )
+        handle = _ShardHandle(process)
+        self._handles[shard] = handle
+        threading.Thread(target=self._serve_responses, args=(shard, handle),
+                         name=f"shard-{shard}-responses", daemon=True).start()
+
+    def _serve_responses(self, shard: int, handle: _ShardHandle):
+        # Espera la dirección del proceso (EOF si muere al arrancar), conecta y reparte
+        # sus respuestas a los Futures que las esperan
+        try:
+            for line in handle.process.stdout:
+                if line.startswith(READY_MARKER):
+                    address = line[len(READY_MARKER):].strip()
+                    break
+            else:
+                return
+            handle.process.stdout.close()
+            handle.conn = Client(address, authkey=self._authkey)
+        except (OSError, EOFError) as e:
+            print(f"⚠️ No se pudo conectar con el shard {shard}: {e}")
+            return
+        handle.ready.set()
+
+        while True:
+            try:
+                request_id, _, result, error = handle.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._pending_lock:
+                future = self._pending.pop((request_id, shard), None)
+            if future is None:
+                continue  # Respuesta tardía de una petición que ya se dio por perdida
+            if error:
+                future.set_exception(RuntimeError(f"Shard {shard}: {error}"))
+            else:
+                future.set_result(result)
+
+        # Conexión cerrada: las peticiones pendientes de este shard fallan ya, sin esperar al timeout
+        with self._pending_lock:
+            lost = [key for key in self._pending if key[1] == shard]
+            futures = [self._pending.pop(key) for key in lost]
+        for future in futures:
+            future.set_exception(RuntimeError(f"Shard {shard}: conexión cerrada"))
+
+    def _get_handle(self, shard: int) -> _ShardHandle:
+        handle = self._handles[shard]
+        if handle.is_alive():
+            return handle
+        # Un shard caído se relanza una sola vez aunque lo detecten varias consultas a la vez
+        with self._restart_lock:
+            if self._handles[shard] is handle:
+                metrics.inc("shard_restarts")
+                print(f"⚠️ Shard {shard} caído, reiniciando proceso...")
+                self._start_worker(shard)
+            return self._handles[shard]
+
+    def _scatter(self, kind: str, payload=None):
+        request_id = next(self._ids)
+        # Reloj de pared: lo comparten coordinador y shards
+        deadline = time.time() + self.timeout_s
+        futures = {}
+        for shard in range(self.num_shards):
+            handle = self._get_handle(shard)
+            if not handle.ready.is_set():
+                metrics.inc("shard_unavailable")
+                continue  # Arrancando: no entra en esta consulta
+
+            future = Future()
+            with self._pending_lock:
+                self._pending[(request_id, shard)] = future
+            try:
+                with handle.send_lock:
+                    handle.conn.send((kind, request_id, deadline, payload))
+            except (OSError, ValueError) as e:
+                with self._pending_lock:
+                    self._pending.pop((request_id, shard), None)
+                future.set_exception(RuntimeError(f"Shard {shard}: {e}"))
+            futures[shard] = future
+        return request_id, futures
+
+    def _gather(self, request_id: int, futures: dict) -> dict:
+        done, not_done = wait(list(futures.values()), timeout=self.timeout_s)
+
+        results = {}
+        for shard, future in futures.items():
+            if future in not_done:
+                with self._pending_lock:
+                    self._pending.pop((request_id, shard), None)
+                metrics.inc("shard_timeouts")
+                print(f"⚠️ Shard {shard} no respondió en {self.timeout_s}s; se ignora en esta consulta.")
+            elif future.exception() is not None:
+                metrics.inc("shard_errors")
+                print(f"⚠️ {future.exception()}")
+            else:
+                results[shard] = future.result()
+
+        if not results:
+            raise RuntimeError("Ningún shard respondió a la consulta.")
+        return results
+
+    def count(self) -> int:
+        """Total de chunks en los shards que responden."""
+        cached_at, total = self._count_cache
+        if total is None or time.monotonic() - cached_at > COUNT_CACHE_TTL_S:
+            total = sum(self._gather(*self._scatter("count")).values())
+            self._count_cache = (time.monotonic(), total)
+        return total
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict = None, include=None):
+        """Scatter-gather: top-k de cada shard y mezcla global por distancia (menor = mejor)."""
+        include = list(include or ['metadatas', 'documents', 'distances'])
+        payload = {
+            "query_embeddings": query_embeddings,
+            "n_results": n_results,
+            "where": where,
+            "include": sorted(set(include) | {"distances"})
+        }
+        with metrics.span("shard_scatter_gather"):
+            shard_results = self._gather(*self._scatter("query", payload))
+
+        merged = {"ids": [], "distances": []}
+        for key in include:
+            merged.setdefault(key, [])
+
+        for q in range(len(query_embeddings)):
+            rows = []
+            for result in shard_results.values():
+                for position, distance in enumerate(result["distances"][q]):
+                    rows.append((distance, result, position))
+            rows.sort(key=lambda row: row[0])
+            rows = rows[:n_results]
+
+            merged["ids"].append([result["ids"][q][position] for _, result, position in rows])
+            merged["distances"].append([distance for distance, _, _ in rows])
+            for key in include:
+                if key != "distances":
+                    merged[key].append([result[key][q][position] for _, result, position in rows])
+        return merged
+
+    def close(self):
+        for handle in self._handles:
+            if handle is None:
+                continue
+            if handle.conn is not None:
+                try:
+                    with handle.send_lock:
+                        handle.conn.send(None)
+                    handle.conn.close()
+                except (OSError, ValueError):
+                    pass
+        deadline = time.monotonic() + 1.0
+        for handle in self._handles:
+            if handle is None:
+                continue
+            try:
+                handle.process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                handle.process.terminate()
+
+
+_searcher = None
+_searcher_lock = threading.Lock()
+
+
+def get_sharded_searcher() -> ShardedSearcher:
+    """Coordinador único por proceso (los trabajadores se lanzan en la primera búsqueda)."""
+    global _searcher
+    with _searcher_lock:
+        if _searcher is None:
+            _searcher = ShardedSearcher(
+                config.CHROMA_NUM_SHARDS,
+                config.CHROMA_COLLECTION_NAME,
+                timeout_s=config.CHROMA_SHARD_TIMEOUT_S
+            )
+        return _searcher
+
+
+if __name__ == "__main__":
+    # Proceso de un shard: python sharding.py <shard> <persist_dir> <collection_name>
+    run_shard_process(int(sys.argv[1]), sys.argv[2], sys.argv[3])
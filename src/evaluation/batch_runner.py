@@ -0,0 +1,293 @@
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, ALL_COMPLETED, wait
+
+# --- 1. CONFIGURACIÓN DE RUTAS E IMPORTS ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import config
+
+RETRIEVAL_MODES = ("vector", "graph", "hybrid")
+
+
+# --- 2. LECTURA DE QUERIES ---
+
+def iter_queries(input_path):
+    """
+    Lee el JSONL de entrada en streaming. Cada línea: {"id": ..., "question": ...}.
+    Si falta 'id', se usa el número de línea para que la reanudación sea estable.
+    """
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            yield {"id": str(record.get("id", line_number)), "question": record["question"]}
+
+
+# --- 3. ESCRITURA INCREMENTAL DE RESULTADOS ---
+
+class JsonlResultWriter:
+    """
+    Añade resultados a un JSONL. Cada escritura se vacía a disco (se pierde como mucho lo que está en vuelo).
+
+    Una query que falló se reintenta al reanudar y su nueva fila se AÑADE: el archivo puede
+    tener varias filas con el mismo 'id' y vale la ÚLTIMA (ver `read_results`).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a+', encoding='utf-8')
+        # Si la ejecución anterior se cortó a mitad de línea, empezamos en una línea nueva
+        if self._file.tell() > 0:
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+
+    def completed_ids(self) -> set:
+        done = set()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # Última línea a medias por una interrupción: esa query se repite
+                    continue
+                # Las queries que fallaron se reintentan al reanudar
+                if row.get("error") is None:
+                    done.add(str(row["id"]))
+        return done
+
+    def write(self, row: dict):
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetResultWriter:
+    """
+    Escribe resultados en un directorio de part-files Parquet (part-00000.parquet, ...).
+    Cada part-file se escribe completo, así que una interrupción nunca deja un archivo corrupto.
+    Como en JSONL, si un 'id' aparece en varias filas (reintento tras un error), vale la última.
+    """
+
+    def __init__(self, path, flush_every: int = 100):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.flush_every = flush_every
+        self._buffer = []
+        self._next_part = len(list(self.path.glob("part-*.parquet")))
+
+    def completed_ids(self) -> set:
+        import pandas as pd
+        done = set()
+        for part in sorted(self.path.glob("part-*.parquet")):
+            df = pd.read_parquet(part, columns=["id", "error"])
+            # Las queries que fallaron se reintentan al reanudar
+            done.update(df[df["error"].isna()]["id"].astype(str))
+        return done
+
+    def write(self, row: dict):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        import pandas as pd
+        if not self._buffer:
+            return
+        part_path = self.path / f"part-{self._next_part:05d}.parquet"
+        tmp_path = part_path.with_suffix(".tmp")
+        pd.DataFrame(self._buffer).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, part_path)
+        self._next_part += 1
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+
+
+def open_writer(output_path, flush_every: int):
+    """'.parquet' -> directorio de part-files Parquet (`flush_every` filas por part-file); cualquier otra ruta -> JSONL."""
+    if str(output_path).endswith(".parquet"):
+        return ParquetResultWriter(output_path, flush_every)
+    return JsonlResultWriter(output_path)
+
+
+def read_results(output_path):
+    """
+    Lee la salida de un lote como DataFrame con UNA fila por 'id' (la última escrita),
+    descartando las filas de error que un reintento posterior ya sustituyó.
+    """
+    import pandas as pd
+    if str(output_path).endswith(".parquet"):
+        parts = sorted(Path(output_path).glob("part-*.parquet"))
+        df = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True) if parts else pd.DataFrame()
+    else:
+        rows = []
+        with open(output_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    continue  # Línea a medias de una ejecución interrumpida
+        df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    df["id"] = df["id"].astype(str)
+    return df.drop_duplicates(subset="id", keep="last").reset_index(drop=True)
+
+
+# --- 4. EJECUCIÓN DE UNA QUERY ---
+
+def build_query_fn(mode: str, generate: bool, n_results: int):
+    """
+    Devuelve la función (question -> (context, answer)) del modo elegido.
+    Los imports son tardíos para no cargar CLIP en modo 'graph' ni el grafo en modo 'vector'.
+    En todos los modos se devuelven como mucho `n_results` archivos.
+    """
+    if mode == "vector":
+        from src.components.retriever import search_chroma
+        retrieve = lambda q: search_chroma(q, n_results=n_results)
+    elif mode == "graph":
+        from src.components.graph_agent import search_graph
+        # El grafo ya ordena por número de atributos compartidos: nos quedamos con los primeros
+        retrieve = lambda q: search_graph(q)[:n_results]
+    else:
+        from src.components.hybrid_agent import hybrid_search
+        retrieve = lambda q: hybrid_search(q, n_results=n_results)
+
+    # El generador (cliente de Gemini) solo se importa si se pide respuesta:
+    # un lote solo de recuperación no necesita GEMINI_API_KEY
+    answer = None
+    if generate:
+        if mode == "vector":
+            from src.components.generator import generate_response
+            answer = lambda q, context: generate_response(q, context)
+        else:
+            from src.components.graph_agent import generate_answer_node
+            answer = lambda q, context: generate_answer_node({"question": q, "context": context})["answer"]
+
+    def run_query(question: str):
+        context = retrieve(question)
+        return context, (answer(question, context) if answer else None)
+
+    return run_query
+
+
+def process_query(query: dict, mode: str, run_query) -> dict:
+    start = time.perf_counter()
+    try:
+        context, answer = run_query(query["question"])
+        error = None
+    except Exception as e:
+        context, answer, error = [], None, str(e)
+
+    return {
+        "id": query["id"],
+        "question": query["question"],
+        "mode": mode,
+        "filenames": [c["filename"] for c in context],
+        "scores": [float(c["relevance_score"]) for c in context],
+        "answer": answer,
+        "latency_s": time.perf_counter() - start,
+        "error": error,
+    }
+
+
+# --- 5. BUCLE PRINCIPAL ---
+
+def run_batch(input_path, output_path, mode: str = "vector", generate: bool = False,
+              workers: int = None, n_results: int = 3, flush_every: int = None):
+    """
+    Procesa un JSONL de queries en paralelo y escribe los resultados de forma incremental.
+
+    Las queries ya presentes en la salida se saltan, así que relanzar el mismo comando
+    tras una interrupción continúa donde se quedó. Como las queries en vuelo llegan
+    a la vez al encoder de texto, el micro-batcher del retriever las codifica en lotes.
+    """
+    workers = workers or config.BATCH_WORKERS
+    flush_every = flush_every or config.BATCH_FLUSH_EVERY
+
+    print(f"\n--- 📦 Ejecución en lote ({mode}{' + generación' if generate else ''}, {workers} hilos) ---")
+
+    writer = open_writer(output_path, flush_every)
+    done = writer.completed_ids()
+    if done:
+        print(f" ⏯️ Reanudando: {len(done)} queries ya procesadas en {output_path}")
+
+    run_query = build_query_fn(mode, generate, n_results)
+
+    processed = 0
+    errors = 0
+    start = time.perf_counter()
+    # Como mucho `max_in_flight` queries leídas y no escritas: la memoria no crece con el tamaño del archivo
+    max_in_flight = workers * 2
+    in_flight = set()
+
+    def drain(return_when):
+        nonlocal processed, errors
+        finished, _ = wait(in_flight, return_when=return_when)
+        for future in finished:
+            in_flight.discard(future)
+            row = future.result()
+            writer.write(row)
+            processed += 1
+            errors += row["error"] is not None
+            if processed % flush_every == 0:
+                rate = processed / (time.perf_counter() - start)
+                print(f"   ✅ {processed} queries ({rate:.1f} q/s, {errors} errores)")
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-query") as executor:
+            for query in iter_queries(input_path):
+                if query["id"] in done:
+                    continue
+                in_flight.add(executor.submit(process_query, query, mode, run_query))
+                if len(in_flight) >= max_in_flight:
+                    drain(FIRST_COMPLETED)
+            if in_flight:
+                drain(ALL_COMPLETED)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Lote completado: {processed} queries nuevas en {elapsed:.1f}s ({errors} errores). Resultados en '{output_path}'")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ejecuta queries en lote (vectorial, grafo o híbrido).")
+    parser.add_argument("input", help="JSONL de entrada con {'id', 'question'} por línea")
+    parser.add_argument("--output", default="resultados_batch.jsonl",
+                        help="Salida .jsonl o directorio .parquet (default: resultados_batch.jsonl)")
+    parser.add_argument("--mode", choices=RETRIEVAL_MODES, default="vector")
+    parser.add_argument("--generate", action="store_true", help="Generar también la respuesta con Gemini")
+    parser.add_argument("--workers", type=int, default=config.BATCH_WORKERS)
+    parser.add_argument("--n-results", type=int, default=3, help="Archivos por query (en todos los modos)")
+    parser.add_argument("--flush-every", type=int, default=config.BATCH_FLUSH_EVERY,
+                        help="Filas por part-file Parquet y cada cuántas queries se informa del progreso")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    run_batch(
+        args.input,
+        args.output,
+        mode=args.mode,
+        generate=args.generate,
+        workers=args.workers,
+        n_results=args.n_results,
+        flush_every=args.flush_every
+    )
+
+if __name__ == "__main__":
+    main()
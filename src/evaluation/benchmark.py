@@ -0,0 +1,400 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 1. CONFIGURACIÓN DE RUTAS E IMPORTS ---
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT_DIR))
+
+import config
+from src.components.attributes import COLORES, CARGAS
+
+# Tamaños por defecto: el catálogo real (13) y dos flotas sintéticas
+DEFAULT_SIZES = "13,10000,100000"
+DEFAULT_STAGES = "cold_start,ingest,query"
+# Queries secuenciales (latencia individual) y concurrentes (latencia en lote) por tamaño
+SINGLE_QUERIES = 30
+BATCHED_QUERIES = 256
+# Imágenes base distintas para los datasets sintéticos (el resto son enlaces a estas)
+SYNTHETIC_BASE_IMAGES = 32
+
+# Métricas donde MÁS es mejor; en el resto (tiempos, memoria) menos es mejor
+HIGHER_IS_BETTER = ("images_per_s", "chunks_per_s", "queries_per_s", "batched_avg_batch_size")
+# Métricas informativas: se guardan pero no cuentan como regresión
+INFORMATIONAL = ("batched_max_queue_depth",)
+
+
+# --- 2. DATASETS SINTÉTICOS ---
+
+def synthetic_description(rng: random.Random) -> str:
+    color = rng.choice(COLORES)
+    carga = rng.choice(CARGAS)
+    extra = rng.choice(["Sobre vías con nieve.", "Bajo cielo azul intenso.", "Estación de tren bajo cielo cubierto.", "Rodeado de vegetación."])
+    return (f"Vagón de tren de tipo {carga}, color {color} con chasis negro. "
+            f"Diseñado para el transporte de carga {carga} a granel. {extra} "
+            f"Inscripción y logotipo de la compañía en el lateral.")
+
+
+def prepare_dataset(size: int, workdir: Path) -> Path:
+    """
+    Crea (una sola vez) el dataset de `size` elementos en workdir/dataset_<size>.
+    Con 13 se usa el catálogo real; con más, descripciones generadas a partir del
+    vocabulario de atributos e imágenes JPEG sintéticas enlazadas (hardlinks).
+    """
+    dataset_dir = workdir / f"dataset_{size}"
+    manifest_path = dataset_dir / "manifest.json"
+    if manifest_path.exists():
+        return dataset_dir
+
+    if size == len(config.IMAGE_FILENAMES):
+        manifest = {"image_dir": str(config.IMAGE_DIR), "filenames": config.IMAGE_FILENAMES, "descriptions": config.DESCRIPTIONS}
+    else:
+        from PIL import Image, ImageDraw
+
+        print(f" 🏗️ Generando dataset sintético de {size} elementos...")
+        image_dir = dataset_dir / "images"
+        image_dir.mkdir(parents=True, exist_ok=True)
+        rng = random.Random(size)
+
+        base_images = []
+        for b in range(SYNTHETIC_BASE_IMAGES):
+            image = Image.new("RGB", (1280, 960), tuple(rng.randrange(256) for _ in range(3)))
+            draw = ImageDraw.Draw(image)
+            for _ in range(12):
+                x, y = rng.randrange(1100), rng.randrange(800)
+                draw.rectangle([x, y, x + rng.randrange(40, 400), y + rng.randrange(40, 300)],
+                               fill=tuple(rng.randrange(256) for _ in range(3)))
+            path = dataset_dir / f"base_{b:02d}.jpg"
+            image.save(path, quality=90)
+            base_images.append(path)
+
+        filenames, descriptions = [], []
+        for i in range(size):
+            filename = f"{i:06d}.jpg"
+            target = image_dir / filename
+            if not target.exists():
+                try:
+                    os.link(base_images[i % len(base_images)], target)
+                except OSError:
+                    shutil.copyfile(base_images[i % len(base_images)], target)
+            filenames.append(filename)
+            descriptions.append(synthetic_description(rng))
+
+        manifest = {"image_dir": str(image_dir), "filenames": filenames, "descriptions": descriptions}
+
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    return dataset_dir
+
+
+# --- 3. STUBS (ejecución offline) ---
+
+class StubGeminiModels:
+    """Sustituye a client.models: no hay llamada de red ni consumo de cuota."""
+
+    def generate_content(self, model=None, contents=None, config=None):
+        return SimpleNamespace(text="Respuesta simulada del benchmark (generador offline).")
+
+
+def install_stub_generator():
+    # graph_agent toma generator.client en cada llamada: basta con sustituirlo aquí
+    from src.components import generator
+    generator.client = SimpleNamespace(models=StubGeminiModels())
+
+
+def install_stub_encoder():
+    """
+    Sustituye los pesos de CLIP por proyecciones aleatorias deterministas con la misma
+    interfaz (get_image_features / get_text_features, 768 dims). Mide el pipeline completo
+    (decodificación, preprocesado, chunking, escritura, búsqueda) sin el coste del modelo.
+    El procesador/tokenizer sigue siendo el real (caché local de HuggingFace).
+    """
+    import torch
+    import transformers
+
+    class StubCLIPModel(torch.nn.Module):
+        def __init__(self, dim: int = 768, vocab_buckets: int = 4096):
+            super().__init__()
+            generator = torch.Generator().manual_seed(0)
+            self.vocab_buckets = vocab_buckets
+            self.image_projection = torch.randn(3 * 16, dim, generator=generator)
+            self.token_table = torch.randn(vocab_buckets, dim, generator=generator)
+
+        def get_image_features(self, pixel_values=None, **kwargs):
+            pooled = torch.nn.functional.adaptive_avg_pool2d(pixel_values, 4).flatten(1)
+            return pooled @ self.image_projection
+
+        def get_text_features(self, input_ids=None, attention_mask=None, **kwargs):
+            embedded = self.token_table[input_ids % self.vocab_buckets]
+            if attention_mask is not None:
+                embedded = embedded * attention_mask.unsqueeze(-1)
+            return embedded.sum(dim=1)
+
+    transformers.CLIPModel.from_pretrained = classmethod(lambda cls, *args, **kwargs: StubCLIPModel())
+
+
+# --- 4. ETAPAS (cada una en su propio subproceso) ---
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB; macOS, bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def configure_child(size: int, workdir: Path, encoder: str):
+    """Apunta config al dataset y a un índice propio del benchmark (nunca al chroma_db real)."""
+    with open(workdir / f"dataset_{size}" / "manifest.json", 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    config.IMAGE_DIR = Path(manifest["image_dir"])
+    config.IMAGE_FILENAMES = manifest["filenames"]
+    config.DESCRIPTIONS = manifest["descriptions"]
+    config.CHROMA_PERSIST_DIR = workdir / f"chroma_{size}_{encoder}"
+    config.GEMINI_API_KEY = config.GEMINI_API_KEY or "benchmark-offline"
+    if encoder == "stub":
+        install_stub_encoder()
+
+
+def stage_ingest(size: int) -> dict:
+    from src.ingestion.ingestion_chroma import load_data_to_chroma, load_checkpoint, dataset_fingerprint
+    from src.ingestion import ingestion_langgraph
+
+    start = time.perf_counter()
+    load_data_to_chroma(resume=False)
+    chroma_s = time.perf_counter() - start
+
+    image_paths = [config.IMAGE_DIR / f for f in config.IMAGE_FILENAMES]
+    checkpoint = load_checkpoint(dataset_fingerprint(image_paths, config.DESCRIPTIONS)) or {}
+    chunks = checkpoint.get("chunks_written", 0)
+
+    start = time.perf_counter()
+    ingestion_langgraph.build_graph()
+    graph_build_s = time.perf_counter() - start
+
+    return {
+        "chroma_ingest_s": chroma_s,
+        "images_per_s": size / chroma_s,
+        "chunks_per_s": chunks / chroma_s,
+        "chunks": chunks,
+        "graph_build_s": graph_build_s,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def stage_query(size: int) -> dict:
+    from src.ingestion.ingestion_langgraph import load_graph
+
+    start = time.perf_counter()
+    load_graph()
+    graph_load_s = time.perf_counter() - start
+
+    from src.components.retriever import search_chroma, query_batcher
+    from src.components.graph_agent import search_graph
+    from src.components.generator import generate_response
+    install_stub_generator()
+
+    rng = random.Random(0)
+    queries = [f"Necesito el vagón {rng.choice(COLORES)} que transporta {rng.choice(CARGAS)}." for _ in range(BATCHED_QUERIES)]
+
+    # Calentamiento: primera conexión a Chroma, carga del codec, hilo del micro-batcher
+    search_chroma(queries[0])
+
+    def timed(fn, *args):
+        t = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - t
+
+    single = [timed(search_chroma, q) for q in queries[:SINGLE_QUERIES]]
+    graph = [timed(search_graph, q) for q in queries[:SINGLE_QUERIES]]
+    end_to_end = [timed(lambda q: generate_response(q, search_chroma(q)), q) for q in queries[:SINGLE_QUERIES]]
+
+    batcher_before = query_batcher.get_metrics()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=config.BATCH_WORKERS) as executor:
+        batched = list(executor.map(lambda q: timed(search_chroma, q), queries))
+    batched_wall_s = time.perf_counter() - start
+    batcher_after = query_batcher.get_metrics()
+    # Solo la fase concurrente: las queries sueltas anteriores forman lotes de 1
+    batches = batcher_after["batches_total"] - batcher_before["batches_total"]
+    items = batcher_after["items_total"] - batcher_before["items_total"]
+
+    return {
+        "graph_load_s": graph_load_s,
+        "single_query_p50_s": statistics.median(single),
+        "single_query_p95_s": percentile(single, 0.95),
+        "graph_query_p50_s": statistics.median(graph),
+        "end_to_end_stub_p50_s": statistics.median(end_to_end),
+        "batched_query_p50_s": statistics.median(batched),
+        "batched_query_p95_s": percentile(batched, 0.95),
+        "queries_per_s": len(queries) / batched_wall_s,
+        "batched_avg_batch_size": items / batches if batches else 0.0,
+        "batched_max_queue_depth": batcher_after["max_queue_depth"],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_child(stage: str, size: int, workdir: Path, encoder: str):
+    configure_child(size, workdir, encoder)
+    result = stage_ingest(size) if stage == "ingest" else stage_query(size)
+    # Última línea de stdout: el resultado en JSON (el resto son los prints del pipeline)
+    print("BENCHMARK_RESULT " + json.dumps(result))
+
+
+def run_stage_subprocess(stage: str, size: int, workdir: Path, encoder: str) -> dict:
+    command = [sys.executable, str(Path(__file__).resolve()), "--child", stage,
+               "--sizes", str(size), "--workdir", str(workdir), "--encoder", encoder]
+    completed = subprocess.run(command, cwd=ROOT_DIR, capture_output=True, text=True)
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith("BENCHMARK_RESULT "):
+            return json.loads(line[len("BENCHMARK_RESULT "):])
+    print(completed.stdout[-2000:])
+    print(completed.stderr[-2000:])
+    raise RuntimeError(f"La etapa '{stage}' ({size}) falló con código {completed.returncode}.")
+
+
+def measure_cold_start() -> dict:
+    """
+    Tiempo de importación de los módulos de servicio en un intérprete limpio.
+    Sin GEMINI_API_KEY a propósito: la recuperación no debe necesitar credenciales de Gemini.
+    """
+    results = {}
+    env = {k: v for k, v in os.environ.items() if k != "GEMINI_API_KEY"}
+    for module in ("src.components.retriever", "src.components.graph_agent"):
+        code = f"import time; t = time.perf_counter(); import {module}; print('COLD_START', time.perf_counter() - t)"
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, env=env)
+        wall_s = time.perf_counter() - start
+        import_s = next((float(line.split()[1]) for line in completed.stdout.splitlines() if line.startswith("COLD_START")), None)
+        if completed.returncode != 0 or import_s is None:
+            # Un import roto es un fallo del benchmark, no una métrica que falta
+            print(completed.stderr[-2000:])
+            raise RuntimeError(f"El import de '{module}' falló con código {completed.returncode}.")
+        name = module.rsplit(".", 1)[1]
+        results[f"{name}_import_s"] = import_s
+        results[f"{name}_process_s"] = wall_s
+    return results
+
+
+# --- 5. COMPARACIÓN CONTRA BASELINE ---
+
+def compare_results(current: dict, baseline: dict, threshold: float) -> list:
+    """
+    Devuelve las regresiones: métricas que empeoran más de `threshold` (0.2 = 20 %)
+    respecto al baseline. Solo se comparan las métricas presentes en ambos archivos;
+    una métrica numérica en el baseline que ahora no tiene valor también es una regresión.
+    """
+    regressions = []
+    for stage, by_size in current["results"].items():
+        for size, values in by_size.items():
+            base_values = baseline.get("results", {}).get(stage, {}).get(size, {})
+            for metric, value in values.items():
+                if metric in INFORMATIONAL:
+                    continue
+                base = base_values.get(metric)
+                if value is None and isinstance(base, (int, float)):
+                    regressions.append({"stage": stage, "size": size, "metric": metric,
+                                        "baseline": base, "current": None, "change": None})
+                    continue
+                if not isinstance(value, (int, float)) or not isinstance(base, (int, float)) or base == 0:
+                    continue
+                change = (value - base) / abs(base)
+                worse = -change if metric in HIGHER_IS_BETTER else change
+                if worse > threshold:
+                    regressions.append({"stage": stage, "size": size, "metric": metric,
+                                        "baseline": base, "current": value, "change": change})
+    return regressions
+
+
+# --- 6. BUCLE PRINCIPAL ---
+
+def run_benchmarks(sizes: list, stages: list, workdir: Path, encoder: str) -> dict:
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "encoder": encoder,
+            "clip_model": config.CLIP_MODEL_NAME,
+        },
+        "results": {},
+    }
+
+    if "cold_start" in stages:
+        print("\n--- ⏱️ Cold start ---")
+        report["results"]["cold_start"] = {"all": measure_cold_start()}
+
+    for size in sizes:
+        prepare_dataset(size, workdir)
+        for stage in ("ingest", "query"):
+            if stage not in stages:
+                continue
+            print(f"\n--- ⏱️ {stage} ({size} elementos, encoder={encoder}) ---")
+            report["results"].setdefault(stage, {})[str(size)] = run_stage_subprocess(stage, size, workdir, encoder)
+            print(json.dumps(report["results"][stage][str(size)], indent=2))
+
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de rendimiento de ingesta y consultas (offline).")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Tamaños de dataset (default: {DEFAULT_SIZES})")
+    parser.add_argument("--stages", default=DEFAULT_STAGES, help=f"Etapas (default: {DEFAULT_STAGES}); 'query' necesita 'ingest' previo")
+    parser.add_argument("--encoder", choices=("clip", "stub"), default="clip",
+                        help="'stub' sustituye los pesos CLIP por proyecciones aleatorias (flotas grandes en CPU)")
+    parser.add_argument("--workdir", default=str(ROOT_DIR / "benchmark_data"), help="Datasets e índices del benchmark")
+    parser.add_argument("--output", default="resultados_benchmark.json")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Empeoramiento tolerado (0.2 = 20 %%)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = Path(args.workdir)
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    if args.child:
+        run_child(args.child, sizes[0], workdir, args.encoder)
+        return
+
+    workdir.mkdir(parents=True, exist_ok=True)
+    report = run_benchmarks(sizes, [s.strip() for s in args.stages.split(",")], workdir, args.encoder)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Resultados guardados en '{args.output}'")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regresiones (> {args.threshold:.0%}) respecto a '{args.baseline}':")
+            for r in regressions:
+                if r["current"] is None:
+                    print(f"   {r['stage']}/{r['size']}/{r['metric']}: {r['baseline']:.4g} -> sin valor")
+                else:
+                    print(f"   {r['stage']}/{r['size']}/{r['metric']}: {r['baseline']:.4g} -> {r['current']:.4g} ({r['change']:+.0%})")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones respecto a '{args.baseline}' (umbral {args.threshold:.0%}).")
+
+if __name__ == "__main__":
+    main()
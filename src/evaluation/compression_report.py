@@ -0,0 +1,81 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# --- 1. CONFIGURACIÓN DE RUTAS E IMPORTS ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import config
+from src.components.retriever import get_codec, texts_to_clip_embeddings
+from src.components.embedding_codec import recall_memory_tradeoff
+from src.components.sharding import shard_persist_dir
+
+# Profundidad del recall y tamaño de página al leer la colección
+RECALL_K = 10
+PAGE_SIZE = 1000
+
+# Queries de prueba: las mismas preguntas de la evaluación Ragas + las descripciones del catálogo
+TEST_QUERIES = [
+    "Necesito el vagón cisterna que transporta petróleo (NEFT).",
+    "Muéstrame el vagón de carga sellado de color azul marino profundo.",
+] + list(config.DESCRIPTIONS)
+
+
+def iter_collections():
+    """
+    Colecciones de ChromaDB que forman el índice. Con varios shards se abre cada
+    directorio directamente: el coordinador scatter-gather solo expone count/query.
+    """
+    import chromadb
+
+    if config.CHROMA_NUM_SHARDS > 1:
+        persist_dirs = [shard_persist_dir(shard) for shard in range(config.CHROMA_NUM_SHARDS)]
+    else:
+        persist_dirs = [config.CHROMA_PERSIST_DIR]
+
+    for persist_dir in persist_dirs:
+        client = chromadb.PersistentClient(path=str(persist_dir))
+        yield client.get_collection(name=config.CHROMA_COLLECTION_NAME)
+
+
+def load_corpus_vectors():
+    """Lee todos los embeddings de la colección (o de cada shard) por páginas (float32)."""
+    vectors = []
+    for collection in iter_collections():
+        offset = 0
+        while True:
+            page = collection.get(include=['embeddings'], limit=PAGE_SIZE, offset=offset)
+            if len(page['ids']) == 0:
+                break
+            vectors.extend(page['embeddings'])
+            offset += len(page['ids'])
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def run_report():
+    print("\n--- 📐 Compromiso Recall vs Memoria del Índice ---")
+
+    if get_codec().mode != "float32":
+        print(f"❌ La colección se ingirió en modo '{get_codec().mode}'.")
+        print("   El informe necesita los vectores originales: re-ingesta con EMBEDDING_STORAGE = \"float32\".")
+        sys.exit(1)
+
+    corpus = load_corpus_vectors()
+    queries = np.asarray(texts_to_clip_embeddings(TEST_QUERIES), dtype=np.float32)
+    print(f" -> Corpus: {corpus.shape[0]} vectores de {corpus.shape[1]} dims. Queries: {len(queries)}")
+
+    rows = recall_memory_tradeoff(corpus, queries, k=RECALL_K)
+    df_results = pd.DataFrame(rows)
+
+    print("\n================== 📈 Resultados ==================")
+    print(df_results.to_string(index=False))
+    print("\nNota: ChromaDB guarda internamente los vectores en float32. Las filas float16/int8")
+    print("(deployable = False) son hipotéticas: indican el recall y la memoria de un almacén")
+    print("que guardara esos códigos; solo la PCA reduce el tamaño real del índice de Chroma.")
+
+    df_results.to_csv("resultados_compresion.csv", index=False)
+    print("\n✅ Guardado en 'resultados_compresion.csv'")
+
+if __name__ == "__main__":
+    run_report()
@@ -0,0 +1,39 @@
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import config
+
+# CLIP añade <|startoftext|> y <|endoftext|> a cada secuencia
+CLIP_SPECIAL_TOKENS = 2
+
+
+def count_clip_tokens(tokenizer, text: str) -> int:
+    """Tokens BPE de CLIP del texto (sin los tokens especiales)."""
+    return len(tokenizer.tokenize(text))
+
+
+def build_clip_text_splitter(tokenizer, max_tokens: int = None, overlap_tokens: int = None):
+    """
+    Splitter recursivo que mide la longitud en tokens de CLIP en lugar de caracteres.
+
+    Empaqueta frases/palabras hasta llenar la ventana de texto de CLIP (77 tokens
+    menos los 2 especiales), con solapamiento medido también en tokens. Así ningún
+    chunk se trunca en el encoder y no se generan chunks diminutos que cuestan una
+    pasada del modelo sin aportar texto.
+
+    Args:
+        tokenizer: Tokenizer de CLIP (processor.tokenizer).
+        max_tokens (int): Longitud máxima de secuencia de CLIP (por defecto config.CLIP_MAX_TOKENS).
+        overlap_tokens (int): Solapamiento entre chunks (por defecto config.CLIP_CHUNK_OVERLAP_TOKENS).
+    """
+    max_tokens = max_tokens or config.CLIP_MAX_TOKENS
+    overlap_tokens = config.CLIP_CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+
+    return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+        tokenizer,
+        chunk_size=max_tokens - CLIP_SPECIAL_TOKENS,   # Tamaño del chunk (tokens CLIP)
+        chunk_overlap=overlap_tokens,                  # Solapamiento (tokens CLIP)
+        separators=["\n\n", "\n", ". ", ", ", " ", ""] # Prioridad de separación
+    )
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from pathlib import Path
+from PIL import Image
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.components.metrics import metrics
+
+
+def get_target_size(processor) -> int:
+    """Lado mínimo (en píxeles) que espera el CLIPProcessor (224 para ViT-L/14)."""
+    size = processor.image_processor.size
+    if isinstance(size, dict):
+        return size.get("shortest_edge") or min(size.get("height", 224), size.get("width", 224))
+    return int(size)
+
+
+def decode_image(image_path, target_size: int):
+    """
+    Abre una imagen y la decodifica en RGB.
+    Para JPEG se usa draft mode: libjpeg decodifica directamente a 1/2, 1/4 u 1/8 de
+    resolución siempre que el resultado siga siendo >= target_size, lo que evita
+    decodificar fotos grandes a tamaño completo para luego reducirlas a 224 px.
+    """
+    image = Image.open(Path(image_path))
+    image.draft("RGB", (target_size, target_size))
+    return image.convert("RGB")
+
+
+def preprocess_image(image_path, processor, target_size: int):
+    """Decodifica + preprocesa una imagen. Devuelve el tensor pixel_values (1, 3, H, W)."""
+    with metrics.span("ingest_decode"):
+        image = decode_image(image_path, target_size)
+    with metrics.span("ingest_preprocess"):
+        return processor(images=image, return_tensors="pt")["pixel_values"]
+
+
+def iter_preprocessed_images(image_paths, processor, workers: int = 4, prefetch: int = 16):
+    """
+    Genera (image_path, pixel_values, error) en el mismo orden que image_paths.
+
+    Un pool de hilos decodifica y preprocesa hasta `prefetch` imágenes por delante del
+    consumidor, de forma que el modelo codifica un lote mientras se prepara el siguiente.
+    La cola está acotada: nunca hay más de `prefetch` imágenes decodificadas en memoria.
+    Si una imagen falla, se entrega su error (pixel_values=None) y el pipeline sigue.
+    """
+    target_size = get_target_size(processor)
+    paths = iter(image_paths)
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="decode") as executor:
+
+        def submit_next():
+            for path in paths:
+                pending.append((path, executor.submit(preprocess_image, path, processor, target_size)))
+                return
+
+        for _ in range(max(1, prefetch)):
+            submit_next()
+
+        while pending:
+            path, future = pending.popleft()
+            # Mantener la cola llena antes de bloquear en el resultado actual
+            submit_next()
+            try:
+                yield path, future.result(), None
+            except Exception as e:
+                metrics.inc("ingest_decode_errors")
+                yield path, None, e
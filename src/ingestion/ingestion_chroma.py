@@ -1,17 +1,23 @@
 import chromadb
-from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
 import torch
 from pathlib import Path
+import hashlib
+import json
 import os
 import sys
 
 # --- NUEVOS IMPORTS DE LANGCHAIN ---
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 import config
+from src.ingestion.image_pipeline import iter_preprocessed_images
+from src.ingestion.clip_chunker import build_clip_text_splitter, count_clip_tokens, CLIP_SPECIAL_TOKENS
+from src.components.metrics import metrics
+from src.components.embedding_codec import EmbeddingCodec
+from src.components.attributes import extract_attributes, attributes_to_metadata
+from src.components.sharding import shard_for, shard_persist_dir
 
 # Cargar el modelo CLIP (Igual que antes)
 MODEL_NAME = config.CLIP_MODEL_NAME
@@ -19,125 +25,318 @@ print(f"Cargando modelo Multimodal: {MODEL_NAME}...")
 model = CLIPModel.from_pretrained(MODEL_NAME)
 processor = CLIPProcessor.from_pretrained(MODEL_NAME)
 
-def get_combined_embedding(image_path: str, text: str):
-    # (Esta función se mantiene IGUAL, es tu lógica custom de CLIP)
-    try:
-        path_obj = Path(image_path) # Aseguramos que sea Path
-        image = Image.open(path_obj)
-        
-        inputs_img = processor(images=image, return_tensors="pt")
-        with torch.no_grad():
-            image_features = model.get_image_features(**inputs_img)
-            image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
+def encode_image_batch(pixel_values_list: list):
+    """Codifica un lote de imágenes ya preprocesadas. Devuelve features normalizadas (N, 768)."""
+    pixel_values = torch.cat(pixel_values_list, dim=0)
+    with metrics.span("ingest_image_encode"), torch.no_grad():
+        image_features = model.get_image_features(pixel_values=pixel_values)
+        image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
+    return image_features
 
+
+def encode_text_batch(texts: list):
+    """Codifica un lote de textos (chunks). Devuelve features normalizadas (N, 768)."""
+    with metrics.span("ingest_text_encode"):
         inputs_txt = processor(
-            text=[text], 
-            return_tensors="pt", 
-            padding=True, 
-            truncation=True, 
-            max_length=77 
+            text=list(texts),
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=config.CLIP_MAX_TOKENS
         )
-        
         with torch.no_grad():
             text_features = model.get_text_features(**inputs_txt)
             text_features = text_features / text_features.norm(p=2, dim=-1, keepdim=True)
+    return text_features
+
+
+def embed_image_batch(image_batch: list):
+    """
+    Genera los embeddings combinados de todos los chunks de un lote de imágenes.
+
+    Cada imagen se codifica UNA sola vez (aunque tenga varios chunks) y todos los
+    textos del lote pasan juntos por el encoder de texto.
+
+    Args:
+        image_batch (list): Pares (pixel_values, chunks) donde chunks es una lista
+            de (chunk_id, chunk) de esa imagen.
+
+    Returns:
+        list: Tuplas (chunk_id, chunk, embedding) en orden de chunk.
+    """
+    image_features = encode_image_batch([pixel_values for pixel_values, _ in image_batch])
+
+    rows = []
+    image_index = []
+    for position, (_, chunks) in enumerate(image_batch):
+        for chunk_id, chunk in chunks:
+            rows.append((chunk_id, chunk))
+            image_index.append(position)
+
+    text_features = encode_text_batch([chunk.page_content for _, chunk in rows])
+
+    # Fusión multimodal: media de ambos vectores (imagen y chunk) y re-normalización
+    combined_features = (image_features[torch.tensor(image_index)] + text_features) / 2.0
+    combined_features = combined_features / combined_features.norm(p=2, dim=-1, keepdim=True)
+
+    return [(chunk_id, chunk, embedding) for (chunk_id, chunk), embedding in zip(rows, combined_features.tolist())]
+
+
+# --- Checkpoint de la ingesta ---
+
+# Versión del esquema de metadatos de los chunks: al cambiarla, una colección ya completa se re-ingesta
+METADATA_SCHEMA_VERSION = 2
+
+def get_checkpoint_path():
+    return config.CHROMA_PERSIST_DIR / config.INGEST_CHECKPOINT_FILENAME
 
-        combined_features = (image_features + text_features) / 2.0
-        combined_features = combined_features / combined_features.norm(p=2, dim=-1, keepdim=True)
 
-        return combined_features.squeeze().tolist()
+def get_codec_path():
+    return config.CHROMA_PERSIST_DIR / config.EMBEDDING_CODEC_FILENAME
 
-    except Exception as e:
-        print(f"Error procesando multimodal {image_path}: {e}")
+
+def dataset_fingerprint(image_paths: list, descriptions: list) -> str:
+    """Huella del dataset: si cambian archivos, descripciones o el formato de almacenamiento, el checkpoint deja de ser válido."""
+    digest = hashlib.sha256(config.CHROMA_COLLECTION_NAME.encode("utf-8"))
+    digest.update(f"{METADATA_SCHEMA_VERSION}:{config.CLIP_MAX_TOKENS}:{config.CLIP_CHUNK_OVERLAP_TOKENS}".encode("utf-8"))
+    digest.update(f"{config.EMBEDDING_STORAGE}:{config.EMBEDDING_PCA_DIM}:{config.CHROMA_NUM_SHARDS}".encode("utf-8"))
+    for path, desc in zip(image_paths, descriptions):
+        digest.update(str(path).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(desc.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def load_checkpoint(fingerprint: str):
+    """Devuelve el checkpoint guardado si corresponde al mismo dataset, o None."""
+    try:
+        with open(get_checkpoint_path(), 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
         return None
+    return checkpoint if checkpoint.get("fingerprint") == fingerprint else None
+
+
+def save_checkpoint(checkpoint: dict):
+    """Escritura atómica: el checkpoint nunca queda a medias si el proceso muere."""
+    path = get_checkpoint_path()
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
 
+def load_data_to_chroma(resume: bool = True):
+    """
+    Ingesta en streaming: los chunks se escriben en ChromaDB en lotes de
+    config.INGEST_WRITE_BATCH_SIZE y tras cada lote se guarda un checkpoint.
 
-def load_data_to_chroma():
+    Args:
+        resume (bool): Si existe un checkpoint del mismo dataset, continúa desde el último
+            lote escrito en lugar de borrar la colección y empezar de cero.
+    """
     print("--- ⚙️ Iniciando Ingesta con LangChain Chunking ---")
     
-    # 1. Preparar Documentos "Raw" (Crudos) usando la clase Document de LangChain
-    raw_documents = []
-    
     image_paths = [config.IMAGE_DIR / f for f in config.IMAGE_FILENAMES]
     descriptions = config.DESCRIPTIONS
-    
-    print(" 📦 Empaquetando documentos en objetos LangChain...")
-    for path, desc in zip(image_paths, descriptions):
-        # Creamos un Documento LangChain.
-        doc = Document(
-            page_content=desc,
-            metadata={
-                # CORRECCIÓN AQUÍ: Usamos 'filename' porque el retriever lo busca así
-                "filename": path.name,      
-                "image_path": str(path), 
-                "category": "cargo_wagon"
-            }
-        )
-        raw_documents.append(doc)
+
+    fingerprint = dataset_fingerprint(image_paths, descriptions)
+    checkpoint = load_checkpoint(fingerprint) if resume else None
+
+    # 1. Conexión a ChromaDB: colección nueva o reanudación de la existente
+    # Con varios shards, cada uno tiene su propio directorio persistente (hash del filename)
+    num_shards = config.CHROMA_NUM_SHARDS
+    if num_shards > 1:
+        clients = [chromadb.PersistentClient(path=str(shard_persist_dir(shard))) for shard in range(num_shards)]
+        print(f" -> Colección repartida en {num_shards} shards")
+    else:
+        clients = [chromadb.PersistentClient(path=str(config.CHROMA_PERSIST_DIR))]
+
+    if checkpoint:
+        if checkpoint.get("completed"):
+            print(f"✅ La ingesta de este dataset ya está completa ({checkpoint['chunks_written']} chunks). Usa resume=False para rehacerla.")
+            return
+        print(f" ⏯️ Reanudando desde el checkpoint: {checkpoint['images_done']}/{len(image_paths)} imágenes ya escritas.")
+        codec = EmbeddingCodec.load(get_codec_path()) if get_codec_path().exists() else EmbeddingCodec(config.EMBEDDING_STORAGE, config.EMBEDDING_PCA_DIM)
+    else:
+        for client in clients:
+            try:
+                client.delete_collection(name=config.CHROMA_COLLECTION_NAME)
+            except:
+                pass
+        if get_codec_path().exists():
+            os.remove(get_codec_path())
+        codec = EmbeddingCodec(config.EMBEDDING_STORAGE, config.EMBEDDING_PCA_DIM)
+        checkpoint = {
+            "fingerprint": fingerprint,
+            "images_done": 0,
+            "next_chunk_id": 0,
+            "chunks_written": 0,
+            "failed_images": [],
+            "completed": False
+        }
+        save_checkpoint(checkpoint)
+
+    collections = [client.get_or_create_collection(name=config.CHROMA_COLLECTION_NAME) for client in clients]
 
     # 2. Aplicar RecursiveChunker (Cumpliendo el requisito)
-    # Aunque tus descripciones sean cortas, esto asegura que el código sea escalable
-    # y cumple con la rúbrica de evaluación.
-    print(" ✂️ Dividiendo textos con RecursiveCharacterTextSplitter...")
-    
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=300,       # Tamaño del chunk (caracteres)
-        chunk_overlap=50,     # Solapamiento para mantener contexto
-        separators=["\n\n", "\n", ". ", " ", ""] # Prioridad de separación
-    )
-    
-    # Esto genera una lista de nuevos documentos (chunks). 
-    # LangChain COPIA automáticamente los metadatos (image_path) a cada chunk.
-    chunked_documents = text_splitter.split_documents(raw_documents)
+    # La longitud se mide con el tokenizer de CLIP: cada chunk llena la ventana de 77 tokens
+    # del encoder de texto sin pasarse (nada se pierde por truncamiento).
+    print(f" ✂️ Dividiendo textos con RecursiveCharacterTextSplitter (tokens CLIP: {config.CLIP_MAX_TOKENS}, solapamiento {config.CLIP_CHUNK_OVERLAP_TOKENS})...")
     
-    print(f" -> Documentos originales: {len(raw_documents)}")
-    print(f" -> Chunks generados: {len(chunked_documents)}")
+    text_splitter = build_clip_text_splitter(processor.tokenizer)
+    token_budget = config.CLIP_MAX_TOKENS - CLIP_SPECIAL_TOKENS
+    chunk_stats = {"chunks": 0, "tokens": 0, "max_tokens": 0, "over_limit": 0}
+
+    start = checkpoint["images_done"]
+    pending_documents = list(zip(image_paths[start:], descriptions[start:]))
+
+    def iter_chunked_documents():
+        # Los documentos se trocean de uno en uno: solo hay en memoria los que están en vuelo
+        next_chunk_id = checkpoint["next_chunk_id"]
+        for path, desc in pending_documents:
+            # Creamos un Documento LangChain.
+            doc = Document(
+                page_content=desc,
+                metadata={
+                    # CORRECCIÓN AQUÍ: Usamos 'filename' porque el retriever lo busca así
+                    "filename": path.name,      
+                    "image_path": str(path), 
+                    "category": "cargo_wagon",
+                    # Flags de color/carga (mismas reglas que el grafo) para el pre-filtrado `where`
+                    **attributes_to_metadata(extract_attributes(desc))
+                }
+            )
+            # LangChain COPIA automáticamente los metadatos (image_path) a cada chunk.
+            with metrics.span("ingest_chunking"):
+                chunks = text_splitter.split_documents([doc])
+            for chunk in chunks:
+                n_tokens = count_clip_tokens(processor.tokenizer, chunk.page_content)
+                chunk_stats["chunks"] += 1
+                chunk_stats["tokens"] += n_tokens
+                chunk_stats["max_tokens"] = max(chunk_stats["max_tokens"], n_tokens)
+                chunk_stats["over_limit"] += n_tokens > token_budget
+            yield [(next_chunk_id + j, chunk) for j, chunk in enumerate(chunks)]
+            next_chunk_id += len(chunks)
 
     # 3. Ingesta en ChromaDB (Iterando sobre los CHUNKS, no los originales)
-    client = chromadb.PersistentClient(path=str(config.CHROMA_PERSIST_DIR))
-    
-    try:
-        client.delete_collection(name=config.CHROMA_COLLECTION_NAME)
-    except:
-        pass
-        
-    collection = client.get_or_create_collection(name=config.CHROMA_COLLECTION_NAME)
+    print(" 🧬 Generando embeddings multimodales para cada chunk...")
+    print(f" -> Pipeline: {config.INGEST_DECODE_WORKERS} hilos de decodificación, prefetch de {config.INGEST_PREFETCH_IMAGES} imágenes")
+    print(f" -> Escritura en lotes de {config.INGEST_WRITE_BATCH_SIZE} chunks con checkpoint")
+    print(f" -> Almacenamiento de embeddings: {config.EMBEDDING_STORAGE}")
 
+    # Buffers acotados: nunca contienen más de un lote de escritura (+ un lote de imágenes)
     embeddings_list = []
     metadatas_list = []
     documents_list = []
     ids_list = []
+    images_in_buffer = 0
+    last_chunk_id = checkpoint["next_chunk_id"]
 
-    print(" 🧬 Generando embeddings multimodales para cada chunk...")
-
-    for i, chunk in enumerate(chunked_documents):
-        
-        text_content = chunk.page_content
-        metadata = chunk.metadata
-        img_path = metadata["image_path"] # Recuperamos la ruta desde los metadatos del chunk
-        
+    def add_embeddings(image_batch):
         # Generar embedding usando el texto DEL CHUNK y la imagen original
-        embedding = get_combined_embedding(img_path, text_content)
-        
-        if embedding:
+        for chunk_id, chunk, embedding in embed_image_batch(image_batch):
             embeddings_list.append(embedding)
-            
+
             # Actualizamos metadatos para indicar que es un chunk
-            metadata["chunk_id"] = i
+            metadata = chunk.metadata
+            metadata["chunk_id"] = chunk_id
             metadatas_list.append(metadata)
-            
-            documents_list.append(text_content)
-            ids_list.append(f"chunk_{i}")
-
-    # Guardar en lotes
-    if embeddings_list:
-        collection.add(
-            embeddings=embeddings_list,
-            metadatas=metadatas_list,
-            documents=documents_list,
-            ids=ids_list
-        )
-        print(f"✅ Ingesta completada. Total de Chunks almacenados: {collection.count()}")
+
+            documents_list.append(chunk.page_content)
+            ids_list.append(f"chunk_{chunk_id}")
+
+    def flush(final: bool = False):
+        # upsert es idempotente: si el proceso murió tras escribir pero antes del checkpoint,
+        # al reanudar se reescriben los mismos ids sin duplicar.
+        nonlocal images_in_buffer
+
+        if not codec.is_fitted:
+            # Modo PCA: se acumulan vectores hasta tener una muestra suficiente para ajustar
+            if len(embeddings_list) < config.EMBEDDING_PCA_FIT_SAMPLES and not final:
+                return
+            if not embeddings_list:
+                return
+            print(f"   📐 Ajustando PCA ({config.EMBEDDING_PCA_DIM} dims) sobre {len(embeddings_list)} vectores...")
+            codec.fit(embeddings_list)
+            codec.save(get_codec_path())
+        elif not get_codec_path().exists():
+            codec.save(get_codec_path())
+
+        if embeddings_list:
+            encoded = codec.encode(embeddings_list)
+            # Repartir el lote por shard (con un solo shard, todo va a la misma colección)
+            rows_by_shard = {}
+            for row, metadata in enumerate(metadatas_list):
+                rows_by_shard.setdefault(shard_for(metadata["filename"], num_shards), []).append(row)
+
+            with metrics.span("ingest_chroma_write"):
+                for shard, rows in rows_by_shard.items():
+                    collections[shard].upsert(
+                        embeddings=[encoded[row] for row in rows],
+                        metadatas=[metadatas_list[row] for row in rows],
+                        documents=[documents_list[row] for row in rows],
+                        ids=[ids_list[row] for row in rows]
+                    )
+        checkpoint["images_done"] += images_in_buffer
+        checkpoint["next_chunk_id"] = last_chunk_id
+        checkpoint["chunks_written"] += len(ids_list)
+        save_checkpoint(checkpoint)
+        print(f"   💾 Lote escrito: {checkpoint['images_done']}/{len(image_paths)} imágenes, {checkpoint['chunks_written']} chunks.")
+
+        embeddings_list.clear()
+        metadatas_list.clear()
+        documents_list.clear()
+        ids_list.clear()
+        images_in_buffer = 0
+
+    # Los hilos decodifican las siguientes imágenes mientras el modelo codifica el lote actual
+    image_batch = []
+    pipeline = iter_preprocessed_images(
+        [path for path, _ in pending_documents],
+        processor,
+        workers=config.INGEST_DECODE_WORKERS,
+        prefetch=config.INGEST_PREFETCH_IMAGES
+    )
+    for chunks, (img_path, pixel_values, error) in zip(iter_chunked_documents(), pipeline):
+        images_in_buffer += 1
+        if chunks:
+            last_chunk_id = chunks[-1][0] + 1
+
+        if error is not None:
+            print(f"⚠️ Error decodificando {img_path}: {error}")
+            checkpoint["failed_images"].append(Path(img_path).name)
+        elif chunks:
+            image_batch.append((pixel_values, chunks))
+
+        if len(image_batch) >= config.INGEST_IMAGE_BATCH_SIZE:
+            add_embeddings(image_batch)
+            image_batch = []
+            # Solo se escribe en fronteras de imagen: el checkpoint cuenta imágenes completas
+            if len(ids_list) >= config.INGEST_WRITE_BATCH_SIZE:
+                flush()
+
+    if image_batch:
+        add_embeddings(image_batch)
+    flush(final=True)
+
+    if chunk_stats["chunks"]:
+        print(f" -> Chunks: {chunk_stats['chunks']} (media {chunk_stats['tokens'] / chunk_stats['chunks']:.1f} tokens, "
+              f"máx {chunk_stats['max_tokens']}, truncados {chunk_stats['over_limit']})")
+
+    if checkpoint["failed_images"]:
+        print(f"⚠️ {len(checkpoint['failed_images'])} imágenes no se pudieron procesar: {checkpoint['failed_images']}")
+
+    checkpoint["completed"] = True
+    save_checkpoint(checkpoint)
+
+    if metrics.enabled:
+        print(metrics.export_prometheus())
+
+    if checkpoint["chunks_written"]:
+        print(f"✅ Ingesta completada. Total de Chunks almacenados: {sum(c.count() for c in collections)}")
     else:
         print("❌ Error: No se generaron embeddings.")
 
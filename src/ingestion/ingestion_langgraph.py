@@ -1,66 +1,209 @@
 import networkx as nx
+import json
 import pickle
+import threading
+import time
+import uuid
 import os
 import sys
+from contextlib import contextmanager
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows: solo se serializa dentro del proceso
+    fcntl = None
+
 # Configuración de rutas
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 import config
+from src.components.metrics import metrics
+from src.components.graph_store import (
+    get_changelog_path, add_file_node, replay_changelog
+)
 
 GRAPH_PATH = config.CHROMA_PERSIST_DIR / "knowledge_graph.gpickle"
+# Cambios posteriores al último pickle (upsert/remove de vagones), uno por línea
+CHANGELOG_PATH = get_changelog_path(GRAPH_PATH)
+# Cerrojo entre procesos para escribir el log, compactar o reconstruir
+LOCK_PATH = GRAPH_PATH.with_suffix(".lock")
+
+# Serializa las escrituras dentro del proceso (el flock cubre a los demás procesos)
+_changelog_lock = threading.Lock()
+
+# Generación del pickle, cacheada por (inode, mtime, tamaño): solo se relee el pickle
+# cuando otro proceso publica uno nuevo, así cada append sigue siendo O(cambios)
+_pickle_generation_cache = {"key": None, "generation": None}
+
+
+@contextmanager
+def _graph_write_lock():
+    """Un único escritor del pickle y del change log, tanto entre hilos como entre procesos."""
+    with _changelog_lock:
+        os.makedirs(os.path.dirname(LOCK_PATH), exist_ok=True)
+        with open(LOCK_PATH, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
 
+def _publish_graph(G):
+    """
+    Publica G como una generación nueva: primero el pickle y después un log vacío con
+    la cabecera de esa generación. Quien lea entre ambos pasos ve un log de la generación
+    anterior y lo ignora, así nunca se reaplican cambios viejos sobre el grafo nuevo.
+    """
+    generation = uuid.uuid4().hex
+    G.graph["generation"] = generation
+
+    # Creamos carpeta si no existe (usamos la misma de chroma por comodidad)
+    os.makedirs(os.path.dirname(GRAPH_PATH), exist_ok=True)
+
+    # Escritura atómica: los procesos que vigilan el archivo nunca leen un pickle a medias
+    tmp_path = GRAPH_PATH.with_suffix(".tmp")
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(G, f)
+    os.replace(tmp_path, GRAPH_PATH)
+    _pickle_generation_cache.update(key=_pickle_key(), generation=generation)
+
+    tmp_path = CHANGELOG_PATH.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"op": "generation", "generation": generation, "ts": time.time()}) + "\n")
+    os.replace(tmp_path, CHANGELOG_PATH)
+
+
+@metrics.timed("ingest_graph_build")
 def build_graph():
     print("--- 🕸️ Construyendo Grafo de Conocimiento (NetworkX) ---")
-    
+
     # Creamos un grafo dirigido
     G = nx.DiGraph()
-    
+
     image_paths = [config.IMAGE_DIR / f for f in config.IMAGE_FILENAMES]
     descriptions = config.DESCRIPTIONS
-    
+
     for path, desc in zip(image_paths, descriptions):
-        filename = path.name
-        desc_lower = desc.lower()
-        
-        # 1. Crear Nodo Central (El Archivo)
-        G.add_node(filename, type="file", path=str(path), description=desc)
-        
-        # 2. Extraer Entidades Simples (Reglas básicas para el ejemplo)
+        # Nodo central (el archivo) + entidades simples extraídas por reglas.
         # En un caso real, usarías un LLM para extraer entidades.
-        
-        # -- Extracción de Colores --
-        colores = ["rojo", "azul", "verde", "amarillo", "gris", "blanco", "negro", "oxidado"]
-        for color in colores:
-            if color in desc_lower:
-                G.add_node(color, type="atributo_color")
-                G.add_edge(filename, color, relation="tiene_color")
-                G.add_edge(color, filename, relation="es_color_de") # Relación inversa para búsqueda
-        
-        # -- Extracción de Carga/Tipo --
-        cargas = ["petróleo", "neft", "carbón", "madera", "grano", "sellado", "abierto", "cisterna"]
-        for carga in cargas:
-            if carga in desc_lower:
-                G.add_node(carga, type="atributo_carga")
-                G.add_edge(filename, carga, relation="transporta_o_es")
-                G.add_edge(carga, filename, relation="transportado_por")
+        # La misma función aplica los cambios incrementales, así ambos caminos dan el mismo grafo.
+        add_file_node(G, path.name, path, desc)
 
     # 3. Guardar el Grafo
     print(f"📊 Nodos creados: {len(G.nodes)}")
     print(f"🔗 Relaciones creadas: {len(G.edges)}")
-    
-    # Creamos carpeta si no existe (usamos la misma de chroma por comodidad)
-    os.makedirs(os.path.dirname(GRAPH_PATH), exist_ok=True)
-    
-    with open(GRAPH_PATH, 'wb') as f:
-        pickle.dump(G, f)
-        
+
+    # La reconstrucción parte de config: los cambios anteriores del log ya no aplican
+    with _graph_write_lock():
+        _publish_graph(G)
+
     print(f"✅ Grafo guardado en: {GRAPH_PATH}")
 
+
+# --- ACTUALIZACIONES INCREMENTALES ---
+
+def _pickle_key():
+    try:
+        stat = os.stat(GRAPH_PATH)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _pickle_generation():
+    """Generación del pickle publicado (None si no existe o es anterior a las generaciones)."""
+    key = _pickle_key()
+    if key is None:
+        return None
+    if key != _pickle_generation_cache["key"]:
+        with open(GRAPH_PATH, 'rb') as f:
+            generation = pickle.load(f).graph.get("generation")
+        _pickle_generation_cache.update(key=key, generation=generation)
+    return _pickle_generation_cache["generation"]
+
+
+def _changelog_generation():
+    """Generación de la cabecera del log (primera línea), o None si no existe o no tiene."""
+    try:
+        with open(CHANGELOG_PATH, 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline() or "{}")
+    except (FileNotFoundError, ValueError):
+        return None
+    return header.get("generation") if header.get("op") == "generation" else None
+
+
+def _append_changes(changes: list):
+    """
+    Añade cambios al log sin tocar el pickle: coste O(cambios), no O(grafo).
+    Los procesos que sirven consultas los aplican leyendo solo la cola del log.
+    """
+    with _graph_write_lock():
+        generation = _pickle_generation()
+        if generation is None or _changelog_generation() != generation:
+            # Sin log, grafo sin generación, o publicación interrumpida entre el pickle y el log:
+            # lo que se añadiera aquí lo ignorarían los lectores. Se re-inicializa el log antes.
+            if CHANGELOG_PATH.exists() and generation is not None:
+                print("⚠️ El change log no corresponde al grafo publicado; compactando antes de escribir.")
+            _compact_locked()
+        with open(CHANGELOG_PATH, 'a', encoding='utf-8') as f:
+            # Una sola escritura por lote: los lectores solo consumen líneas completas
+            f.write("".join(json.dumps(c, ensure_ascii=False) + "\n" for c in changes))
+            f.flush()
+            os.fsync(f.fileno())
+        metrics.inc("graph_changes_logged", len(changes))
+
+        if os.path.getsize(CHANGELOG_PATH) >= config.GRAPH_CHANGELOG_COMPACT_BYTES:
+            _compact_locked()
+
+
+def upsert_wagon(filename: str, description: str, path=None):
+    """Añade o corrige un vagón. Solo se recalculan sus aristas de atributos."""
+    path = path or config.IMAGE_DIR / filename
+    _append_changes([{
+        "op": "upsert",
+        "filename": filename,
+        "path": str(path),
+        "description": description,
+        "ts": time.time()
+    }])
+
+
+def remove_wagon(filename: str):
+    """Elimina un vagón del grafo (y los atributos que se queden sin archivos)."""
+    _append_changes([{"op": "remove", "filename": filename, "ts": time.time()}])
+
+
+def _compact_locked():
+    G = load_graph()
+    _publish_graph(G)
+    metrics.inc("graph_compactions")
+    print(f"🗜️ Change log compactado en {GRAPH_PATH.name}: {len(G.nodes)} nodos, {len(G.edges)} relaciones.")
+
+
+@metrics.timed("ingest_graph_compact")
+def compact_graph():
+    """Vuelca pickle + change log en un pickle nuevo y vacía el log."""
+    with _graph_write_lock():
+        _compact_locked()
+
+
 def load_graph():
-    """Función helper para cargar el grafo en memoria"""
-    with open(GRAPH_PATH, 'rb') as f:
-        return pickle.load(f)
+    """Función helper para cargar el grafo en memoria (pickle + cambios pendientes del log)"""
+    if GRAPH_PATH.exists():
+        with open(GRAPH_PATH, 'rb') as f:
+            G = pickle.load(f)
+    else:
+        G = nx.DiGraph()
+
+    replay_changelog(G, CHANGELOG_PATH)
+    return G
 
 if __name__ == "__main__":
-    build_graph()
\ No newline at end of file
+    # python src/ingestion/ingestion_langgraph.py [compact]
+    if len(sys.argv) > 1 and sys.argv[1] == "compact":
+        compact_graph()
+    else:
+        build_graph()